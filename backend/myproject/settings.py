@@ -43,6 +43,8 @@ AUTH_USER_MODEL = 'todoDataBase.User'
 # Путь, куда будут загружаться медиа-файлы
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Дисковый кэш собранных спрайтов персонажей (todoDataBase/sprite.py)
+SPRITE_CACHE_DIR = os.path.join(MEDIA_ROOT, 'sprites')
 
 
 # Application definition
@@ -154,6 +156,31 @@ DATABASES = {
 
 }
 
+if DATABASES["default"].get("ENGINE") == "django.db.backends.sqlite3":
+    # Многопоточным тестам (tests.py) нужна файловая тестовая БД:
+    # in-memory SQLite с общим кэшем отвечает "table is locked"
+    DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = 30
+    DATABASES["default"]["TEST"] = {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")}
+
+# Общий для всех процессов кэш: версии каталога и лестницы рангов, данные
+# персонажей и множества друзей должны сбрасываться во всех воркерах сразу.
+# Redis при REDIS_URL, иначе таблица в основной БД (создаётся миграцией
+# todoDataBase 0036 или python manage.py createcachetable).
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
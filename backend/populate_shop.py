@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
+import hashlib
 import os
 import sys
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import django
 from django.core.management import call_command
+from django.db import transaction
 
 # ---- Настройка PYTHONPATH и Django ----
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))  # предполагаем, что скрипт лежит в корне репо
@@ -12,6 +17,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 django.setup()
 
 # ---- Импорт моделей после django.setup() ----
+from todoDataBase.catalog import bump_catalog_version
 from todoDataBase.models import Shop, Rank
 
 # ---- Функции для загрузки/создания рангов ----
@@ -100,12 +106,89 @@ def build_media_url(full_path, base_domain):
 
 
 # ---- Основная логика наполнения магазина ----
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif')
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+READ_CHUNK = 1024 * 1024
+# Поля, которые синхронизация обновляет у существующих предметов.
+# Цена, ранг и описание не трогаем: их могли поменять в админке
+SYNC_FIELDS = ['type', 'is_default', 'image_preview_url', 'image_character_url', 'content_hash']
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return path, digest.hexdigest()
+
+
+def scan_images(media_root):
+    paths = []
+    for root, dirs, files in os.walk(media_root):
+        paths.extend(os.path.join(root, filename) for filename in files
+                     if filename.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def hash_files(paths):
+    """
+    {путь: sha256} для всех файлов. hashlib и чтение файла отпускают GIL,
+    поэтому пула потоков достаточно.
+    """
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        return dict(pool.map(file_hash, paths))
+
+
+def create_default_items(base_domain):
+    # Если нет папки с изображениями — создаем несколько дефолтных предметов
+    print("Папка с изображениями не найдена, создаем стандартные предметы...")
+    default_items = [
+        {
+            'type': 'warrior',
+            'name': 'warrior_default',
+            'description': 'Стандартный воин',
+            'price': 0,
+            'is_default': True,
+            'image_preview_url': f'{base_domain.rstrip("/")}/static/default_images/warrior.png',
+            'image_character_url': f'{base_domain.rstrip("/")}/static/default_images/warrior.png',
+        },
+        {
+            'type': 'mage',
+            'name': 'mage_default',
+            'description': 'Стандартный маг',
+            'price': 0,
+            'is_default': True,
+            'image_preview_url': f'{base_domain.rstrip("/")}/static/default_images/mage.png',
+            'image_character_url': f'{base_domain.rstrip("/")}/static/default_images/mage.png',
+        }
+    ]
+
+    for item_data in default_items:
+        obj, created = Shop.objects.get_or_create(
+            name=item_data['name'],
+            defaults={
+                'type': item_data['type'],
+                'description': item_data['description'],
+                'required_rank': None,
+                'price': item_data['price'],
+                'is_default': item_data['is_default'],
+                'image_preview_url': item_data['image_preview_url'],
+                'image_character_url': item_data['image_character_url'],
+            }
+        )
+        print(f"{'Добавлен' if created else 'Существовал'} стандартный предмет: {obj.name}")
+
+
 def populate_shop():
-    # Если магазин уже заполнен — пропускаем (как в твоём варианте)
-    if Shop.objects.exists():
-        print("Магазин уже заполнен, пропускаем создание предметов.")
-        return
+    """
+    Инкрементальная синхронизация магазина с media/shop_items/characters.
 
+    Файлы хэшируются параллельно и сравниваются с content_hash в базе;
+    новые и изменившиеся предметы записываются одним bulk_create с
+    update_conflicts по имени. bulk_create не шлёт сигналы, поэтому версия
+    каталога (catalog.py) поднимается явно — в общем кэше, так что
+    запущенные веб-процессы сразу отдают новый каталог.
+    """
     # Убедимся, что ранги есть (если нет — загрузим/создадим)
     ensure_ranks()
 
@@ -113,123 +196,76 @@ def populate_shop():
         print("After ensuring, no ranks exist - aborting shop population to avoid FK issues.")
         return
 
-    print("Начинаем заполнение магазина...")
-
     # Расположение медиа (адаптировано для Render и локальной разработки)
     MEDIA_ROOT = os.path.join(PROJECT_ROOT, 'media', 'shop_items', 'characters')
     BASE_DOMAIN = os.environ.get('RENDER_EXTERNAL_URL') or os.environ.get('BASE_DOMAIN') or 'http://localhost:8000'
 
-    # Если нет папки с изображениями — создаем несколько дефолтных предметов
     if not os.path.exists(MEDIA_ROOT):
-        print("Папка с изображениями не найдена, создаем стандартные предметы...")
-        default_items = [
-            {
-                'type': 'warrior',
-                'name': 'warrior_default',
-                'description': 'Стандартный воин',
-                'price': 0,
-                'is_default': True,
-                'image_preview_url': f'{BASE_DOMAIN.rstrip("/")}/static/default_images/warrior.png',
-                'image_character_url': f'{BASE_DOMAIN.rstrip("/")}/static/default_images/warrior.png',
-            },
-            {
-                'type': 'mage',
-                'name': 'mage_default',
-                'description': 'Стандартный маг',
-                'price': 0,
-                'is_default': True,
-                'image_preview_url': f'{BASE_DOMAIN.rstrip("/")}/static/default_images/mage.png',
-                'image_character_url': f'{BASE_DOMAIN.rstrip("/")}/static/default_images/mage.png',
-            }
-        ]
-
-        for item_data in default_items:
-            obj, created = Shop.objects.get_or_create(
-                name=item_data['name'],
-                defaults={
-                    'type': item_data['type'],
-                    'description': item_data['description'],
-                    'required_rank': None,
-                    'price': item_data['price'],
-                    'is_default': item_data['is_default'],
-                    'image_preview_url': item_data['image_preview_url'],
-                    'image_character_url': item_data['image_character_url'],
-                }
-            )
-            print(f"{'Добавлен' if created else 'Существовал'} стандартный предмет: {obj.name}")
+        create_default_items(BASE_DOMAIN)
         return
 
-    # Если папка с изображениями существует — обрабатываем файлы
-    created_count = 0
-    for root, dirs, files in os.walk(MEDIA_ROOT):
-        for filename in files:
-            if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.gif')):
-                continue
-
-            full_path = os.path.join(root, filename)
-            item_type = detect_type(full_path)
-            if not item_type:
-                print(f"Не удалось определить тип для файла {filename}, пропускаем.")
-                continue
-
-            name = os.path.splitext(filename)[0]
-            is_default = 'default' in name.lower()
-            description = f"Описание для {name}"
-
-            if is_default:
-                price = 0
-                required_rank = None
-            else:
-                price = random.randint(50, 500)
-                # Выбираем случайный ранк, исключая нулевой (если есть)
-                available_ranks = list(Rank.objects.exclude(required_xp=0))
-                if available_ranks:
-                    required_rank = random.choice(available_ranks)
-                else:
-                    required_rank = Rank.objects.order_by('level').first()
-
-            # Формируем публичный URL для файла
-            media_url = build_media_url(full_path, BASE_DOMAIN)
-
-            # Создаем объект магазина (избегаем дублирования по имени)
-            shop_obj, created = Shop.objects.get_or_create(
-                name=name,
-                defaults={
-                    'type': item_type,
-                    'description': description,
-                    'required_rank': required_rank,
-                    'price': price,
-                    'is_default': is_default,
-                    'image_preview_url': media_url,
-                    'image_character_url': media_url,
-                }
+    print("Синхронизируем магазин...")
+    started = time.monotonic()
+    hashes = hash_files(scan_images(MEDIA_ROOT))
+
+    existing = {
+        name: (content_hash, url)
+        for name, content_hash, url in Shop.objects.values_list('name', 'content_hash', 'image_character_url')
+    }
+    # Случайный ранг для новых предметов, исключая нулевой (если есть)
+    ranks = list(Rank.objects.exclude(required_xp=0)) or list(Rank.objects.order_by('level')[:1])
+
+    changed, seen = [], set()
+    created_count = unchanged_count = 0
+    for full_path, content_hash in hashes.items():
+        item_type = detect_type(full_path)
+        if not item_type:
+            print(f"Не удалось определить тип для файла {full_path}, пропускаем.")
+            continue
+
+        name = os.path.splitext(os.path.basename(full_path))[0]
+        if name in seen:
+            print(f"Повторяющееся имя {name} ({full_path}), пропускаем.")
+            continue
+        seen.add(name)
+
+        # Хэш в URL: новая картинка — новый адрес для клиентов и спрайтов
+        media_url = f"{build_media_url(full_path, BASE_DOMAIN)}?v={content_hash[:12]}"
+        if existing.get(name) == (content_hash, media_url):
+            unchanged_count += 1
+            continue
+
+        is_default = 'default' in name.lower()
+        if name not in existing:
+            created_count += 1
+        changed.append(Shop(
+            name=name,
+            type=item_type,
+            description=f"Описание для {name}",
+            required_rank=None if is_default or not ranks else random.choice(ranks),
+            price=0 if is_default else random.randint(50, 500),
+            is_default=is_default,
+            image_preview_url=media_url,
+            image_character_url=media_url,
+            content_hash=content_hash,
+        ))
+
+    if changed:
+        with transaction.atomic():
+            Shop.objects.bulk_create(
+                changed,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=SYNC_FIELDS,
             )
-            if created:
-                created_count += 1
-                print(f"Добавлен предмет: {name} (type={item_type}, price={price}, rank={getattr(required_rank, 'name', None)})")
-            else:
-                # Обновляем данные на случай изменений
-                updated = False
-                if shop_obj.price != price:
-                    shop_obj.price = price
-                    updated = True
-                if shop_obj.description != description:
-                    shop_obj.description = description
-                    updated = True
-                if shop_obj.required_rank != required_rank:
-                    shop_obj.required_rank = required_rank
-                    updated = True
-                if shop_obj.image_preview_url != media_url or shop_obj.image_character_url != media_url:
-                    shop_obj.image_preview_url = media_url
-                    shop_obj.image_character_url = media_url
-                    updated = True
-                if updated:
-                    shop_obj.save()
-                    print(f"Обновлён предмет: {name}")
-                else:
-                    print(f"Предмет уже существует без изменений: {name}")
-
-    print(f"Готово. Добавлено предметов: {created_count}")
+            bump_catalog_version()
+
+    print(
+        f"Готово за {time.monotonic() - started:.2f}s. Файлов: {len(hashes)}, "
+        f"добавлено: {created_count}, обновлено: {len(changed) - created_count}, "
+        f"без изменений: {unchanged_count}"
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,96 @@
+"""
+Кэш каталога магазина под версией.
+
+Каталог меняется только при запуске populate_shop.py или правках в админке,
+поэтому сериализованный список хранится в кэше под ключом с версией, а
+клиент получает сильный ETag и 304, если каталог не изменился.
+Запись в Shop/Rank (сигналы в signals.py) устанавливает новую версию.
+Версия хранится в общем кэше (settings.CACHES) и видна всем веб-процессам,
+в том числе после populate_shop.py, запущенного отдельным процессом.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+VERSION_KEY = 'shop_catalog:version'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен: новая версия, чтобы не совпасть со старыми записями
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # После коммита: иначе параллельный запрос закэширует ещё старый каталог под новой версией
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), None))
+
+
+def catalog_payload(request):
+    """
+    (etag, data) сериализованного каталога. URL картинок абсолютные,
+    поэтому в ключе есть хост.
+    """
+    from .models import Shop  # Avoid circular import
+    from .serializers import ItemSerializer
+
+    key = f'shop_catalog:{catalog_version()}:{request.get_host()}'
+    cached = cache.get(key)
+    if cached is None:
+        items = Shop.objects.select_related('required_rank').order_by('id')
+        data = ItemSerializer(items, many=True, context={'request': request}).data
+        body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        cached = (f'"{hashlib.sha256(body).hexdigest()}"', list(data))
+        cache.set(key, cached, CACHE_TIMEOUT)
+    return cached
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return header.strip() == '*' or etag in (tag.strip() for tag in header.split(','))
+
+
+def default_items():
+    """
+    [(id, слот), ...] дефолтных предметов. Хранится под версией каталога,
+    поэтому регистрация не читает Shop.
+    """
+    from .models import Shop, Inventory  # Avoid circular import
+
+    key = f'shop_catalog:{catalog_version()}:defaults'
+    items = cache.get(key)
+    if items is None:
+        items = [
+            (item_id, Inventory.slot_for(item_type))
+            for item_id, item_type in Shop.objects.filter(is_default=True).order_by('id').values_list('id', 'type')
+        ]
+        cache.set(key, items, CACHE_TIMEOUT)
+    return items
+
+
+def provision_default_items(users):
+    """
+    Выдаёт дефолтные предметы пользователям одним bulk_create.
+    Надевается первый предмет в каждом слоте (один надетый на слот).
+    """
+    from .models import Inventory  # Avoid circular import
+
+    rows = []
+    for user in users:
+        taken = set()
+        for item_id, slot in default_items():
+            rows.append(Inventory(
+                user_id=user.id, item_id=item_id, slot=slot,
+                is_equipped=slot not in taken, is_unlocked=True, is_purchased=True,
+            ))
+            taken.add(slot)
+    # Повторная выдача (или уже надетый предмет в слоте) не ошибка
+    Inventory.objects.bulk_create(rows, ignore_conflicts=True, batch_size=5000)
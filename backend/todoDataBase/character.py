@@ -0,0 +1,83 @@
+"""
+Данные персонажа для GET /api/character/get-character/: собираются одним
+запросом (инвентарь + предметы + ранги предметов) и кэшируются на пользователя.
+
+Кэш сбрасывается при изменении инвентаря, золота, XP или аватара:
+сигналы на Inventory/User и явные вызовы после UPDATE'ов в обход save().
+Кэш общий для всех воркеров (settings.CACHES), поэтому сброс виден сразу везде.
+Правки каталога (Shop/Rank) меняют версию в ключе.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
+
+from .catalog import catalog_version
+
+CACHE_TIMEOUT = 300
+
+
+def cache_key(user_id):
+    # Версия каталога в ключе: правка предметов/рангов сбрасывает и данные персонажей
+    return f'character:{user_id}:{catalog_version()}'
+
+
+def prefetch_character(user):
+    from .models import Inventory  # Avoid circular import
+    prefetch_related_objects([user], Prefetch(
+        'inventory',
+        queryset=Inventory.objects.select_related('item__required_rank').order_by('id'),
+        to_attr='character_inventory',
+    ))
+    return user
+
+
+def character_payload(request):
+    from .serializers import CharacterSerializer  # Avoid circular import
+    user = request.user
+    key = cache_key(user.id)
+    payload = cache.get(key)
+    if payload is None:
+        payload = CharacterSerializer(prefetch_character(user), context={'request': request}).data
+        cache.set(key, payload, CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_character(*user_ids):
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Повторно после коммита: параллельный запрос мог закэшировать ещё старые данные
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def apply_loadout(user, chosen):
+    """
+    Надевает предметы по слотам: chosen — {слот: Inventory или None}.
+    Два set-based UPDATE в одной транзакции: снять всё лишнее в затронутых
+    слотах, затем надеть выбранное. Единственность предмета в слоте
+    гарантирует частичный уникальный индекс, а не чтение перед записью.
+    """
+    from .models import Inventory  # Avoid circular import
+    equip_ids = [entry.id for entry in chosen.values() if entry is not None]
+    with transaction.atomic():
+        Inventory.objects.filter(
+            user=user, slot__in=list(chosen), is_equipped=True
+        ).exclude(id__in=equip_ids).update(is_equipped=False)
+        if equip_ids:
+            Inventory.objects.filter(id__in=equip_ids, is_equipped=False).update(is_equipped=True)
+        invalidate_character(user.id)
+
+
+def is_worn_outfit(item_ids):
+    """Есть пользователь, у которого надеты ровно эти предметы (id из Shop)."""
+    from .models import Inventory  # Avoid circular import
+    item_ids = set(item_ids)
+    if not item_ids:
+        return False
+    equipped = Inventory.objects.filter(is_equipped=True)
+    # Кандидаты — владельцы одного из предметов; у них сверяем весь надетый набор
+    wearers = equipped.filter(item_id=min(item_ids)).values('user_id')
+    return equipped.filter(user_id__in=wearers).values('user_id').annotate(
+        worn=Count('id'), matched=Count('id', filter=Q(item_id__in=item_ids)),
+    ).filter(worn=len(item_ids), matched=len(item_ids)).exists()
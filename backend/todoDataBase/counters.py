@@ -0,0 +1,64 @@
+"""
+Денормализованные счётчики пользователя для экрана друзей
+(User.COUNTER_FIELDS).
+
+Счётчики сдвигаются в БД (User.objects.adjust_counters) в той же транзакции,
+что и запись: save() задач, запросов в друзья и дружбы, сигналы удаления и
+массовые UPDATE задач (завершение, отмена, сброс периодических).
+reconcile_counters пересчитывает их по исходным таблицам: миграция 0034
+заполняет так новые поля, команда reconcile_user_counters исправляет расхождения.
+"""
+from functools import reduce
+from operator import or_
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('id')
+    ).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def actual_counters(apps=global_apps):
+    """Выражения для UPDATE/annotate: значения счётчиков по исходным таблицам."""
+    Task, Friendship, FriendRequest = (
+        apps.get_model('todoDataBase', name) for name in ('Task', 'Friendship', 'FriendRequest')
+    )
+    return {
+        'completed_tasks_count': _count(Task.objects.filter(is_completed=True), 'user'),
+        'friends_count': _count(Friendship.objects.all(), 'user1') + _count(Friendship.objects.all(), 'user2'),
+        'pending_requests_count': _count(FriendRequest.objects.filter(accepted=False), 'to_user'),
+    }
+
+
+def reconcile_counters(chunk_size=1000, on_chunk=None, apps=global_apps):
+    """
+    Сверяет счётчики пачками пользователей (keyset по id) и переписывает
+    только разошедшиеся строки. Возвращает число исправленных пользователей.
+    apps — реестр моделей: в миграции передаётся исторический.
+    """
+    User = apps.get_model('todoDataBase', 'User')
+    last_id = fixed = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not user_ids:
+            return fixed
+        last_id = user_ids[-1]
+
+        counters = actual_counters(apps)
+        with transaction.atomic():
+            drifted = list(User.objects.filter(id__in=user_ids).annotate(
+                **{f'actual_{name}': expression for name, expression in counters.items()}
+            ).filter(
+                reduce(or_, (~Q(**{name: F(f'actual_{name}')}) for name in counters))
+            ).values_list('id', flat=True))
+            if drifted:
+                User.objects.filter(id__in=drifted).update(**counters)
+        fixed += len(drifted)
+        if on_chunk:
+            on_chunk(len(user_ids), len(drifted))
@@ -0,0 +1,57 @@
+"""
+Кэш множеств id друзей пользователя для проверок дружбы
+(Friendship.are_friends / are_friends_bulk).
+
+Множество строится одним запросом и сбрасывается при создании дружбы
+(Friendship.save) и её удалении (сигнал в signals.py). Промах по кэшу
+перепроверяется в БД: кэш другого процесса мог ещё не узнать о новой дружбе.
+Проверки перед записью (приглашения в задачи) передают verify=True и читают
+друзей из БД: удалённая дружба не должна давать доступ, пока живёт кэш.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+CACHE_TIMEOUT = 300
+
+
+def cache_key(user_id):
+    return f'friends:{user_id}'
+
+
+def _load(user_id):
+    from .models import Friendship  # Avoid circular import
+    ids = set()
+    for pair in Friendship.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).values_list('user1_id', 'user2_id'):
+        ids.update(pair)
+    ids.discard(user_id)
+    return frozenset(ids)
+
+
+def friend_ids(user_id, refresh=False):
+    key = cache_key(user_id)
+    ids = None if refresh else cache.get(key)
+    if ids is None:
+        ids = _load(user_id)
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+def are_friends_bulk(user_id, other_ids, verify=False):
+    """
+    {id: дружат ли}; все друзья — одно чтение кэша, без запросов.
+    verify=True — один запрос к БД (и обновление кэша) вместо чтения кэша.
+    """
+    ids = friend_ids(user_id, refresh=verify)
+    if not verify and not set(other_ids) <= ids:
+        ids = friend_ids(user_id, refresh=True)
+    return {other_id: other_id in ids for other_id in other_ids}
+
+
+def invalidate_friends(*user_ids):
+    keys = [cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Повторно после коммита: параллельный запрос мог закэшировать ещё старое множество
+    transaction.on_commit(lambda: cache.delete_many(keys))
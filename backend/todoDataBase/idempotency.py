@@ -0,0 +1,54 @@
+"""
+Поддержка заголовка Idempotency-Key для небезопасных запросов (покупки).
+
+Первый запрос с ключом резервирует его вставкой IdempotencyRecord в той же
+транзакции, что и сама операция; параллельный дубликат ждёт на уникальном
+индексе и после коммита получает сохранённый ответ. Ответы 5xx не
+сохраняются — ключ освобождается для повторной попытки.
+"""
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+
+
+def idempotent(request, scope, handler):
+    """
+    Выполняет handler() -> Response не больше одного раза на пару
+    (пользователь, ключ). scope привязывает ключ к эндпоинту и объекту.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > IdempotencyRecord._meta.get_field('key').max_length:
+        return Response({'detail': f'{HEADER} слишком длинный'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(user=request.user, key=key, scope=scope)
+        except IntegrityError:
+            record = None
+
+        if record is not None:
+            response = handler()
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+                return response
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=['status_code', 'response'])
+            return response
+
+    record = IdempotencyRecord.objects.get(user=request.user, key=key)
+    if record.scope != scope:
+        return Response(
+            {'detail': f'{HEADER} уже использован для другого запроса'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
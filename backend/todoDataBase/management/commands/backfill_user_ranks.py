@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from todoDataBase.models import User
+from todoDataBase.ranks import rank_case
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает сохранённый ранг (User.rank) по XP для всех пользователей. "
+            "Запускать после правок лестницы рангов (при добавлении поля ранг заполняет миграция 0028).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько пользователей обновлять одним UPDATE")
+
+    def handle(self, *args, chunk_size, **options):
+        rank = rank_case()
+        last_id = processed = 0
+        while True:
+            user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            # Один UPDATE на пачку: CASE по лестнице рангов
+            processed += User.objects.filter(id__in=user_ids).update(rank_id=rank)
+            self.stdout.write(f"Обработано: {processed}")
+
+        self.stdout.write(self.style.SUCCESS("Ранги пересчитаны"))
@@ -0,0 +1,83 @@
+import time
+import tracemalloc
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from todoDataBase.models import User, Task
+from todoDataBase.recurring import DAILY, WEEKLY, reset_expired_tasks
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк сброса Daily/Weekly задач: создаёт N просроченных выполненных задач, "
+            "сбрасывает их reset_expired_tasks и проверяет пиковую память. "
+            "Всё выполняется в транзакции, которая в конце откатывается.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=1_000_000, help="Сколько задач создать")
+        parser.add_argument('--users', type=int, default=1000, help="Между сколькими пользователями их распределить")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Размер пачки сброса")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Размер пачки bulk_create при заполнении")
+        parser.add_argument('--max-memory-mb', type=float, default=64,
+                            help="Допустимый пик памяти Python во время сброса")
+
+    def handle(self, *args, tasks, users, chunk_size, batch_size, max_memory_mb, **options):
+        try:
+            with transaction.atomic():
+                seeded_users = self.seed(tasks, users, batch_size)
+
+                tracemalloc.start()
+                started = time.monotonic()
+                total = reset_expired_tasks(chunk_size=chunk_size)
+                elapsed = time.monotonic() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                left = Task.objects.filter(user_id__in=seeded_users, is_completed=True).count()
+                raise Rollback
+        except Rollback:
+            pass
+
+        peak_mb = peak / 2 ** 20
+        self.stdout.write(
+            f"Сброшено задач: {total} за {elapsed:.2f} c ({total / max(elapsed, 1e-9):.0f} задач/с), "
+            f"пик памяти: {peak_mb:.1f} МБ"
+        )
+        if left:
+            raise CommandError(f"Не сброшено задач: {left}")
+        if peak_mb > max_memory_mb:
+            raise CommandError(f"Пик памяти {peak_mb:.1f} МБ больше допустимых {max_memory_mb} МБ")
+        self.stdout.write(self.style.SUCCESS("Память при сбросе не зависит от числа задач"))
+
+    def seed(self, tasks, users, batch_size):
+        password = make_password(None)
+        per_user = [tasks // users + (1 if i < tasks % users else 0) for i in range(users)]
+        created = User.objects.bulk_create([
+            User(email=f'reset-bench-{i}@example.invalid', username=f'reset-bench-{i}',
+                 password=password, completed_tasks_count=count)
+            for i, count in enumerate(per_user)
+        ], batch_size=batch_size)
+        user_ids = [user.id for user in created]
+        if None in user_ids:
+            # Бэкенд без RETURNING: перечитываем id
+            user_ids = list(User.objects.filter(email__startswith='reset-bench-').values_list('id', flat=True))
+
+        expired = timezone.now() - timedelta(days=8)
+        rows = (
+            Task(user_id=user_ids[i % users], title=f'Задача {i}', type=DAILY if i % 2 else WEEKLY,
+                 is_completed=True, completed_at=expired, reward_xp=5, reward_gold=10)
+            for i in range(tasks)
+        )
+        # Генератор + пачки: при заполнении тоже не держим все задачи в памяти
+        while batch := list(islice(rows, batch_size)):
+            Task.objects.bulk_create(batch)
+        self.stdout.write(f"Создано задач: {tasks} у {users} пользователей")
+        return user_ids
@@ -0,0 +1,91 @@
+import math
+import statistics
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from todoDataBase.models import User, Task, TaskCollaborator
+from todoDataBase.pagination import TaskSearchPagination
+from todoDataBase.search import search_tasks
+
+FILLER = ['купить', 'молоко', 'позвонить', 'маме', 'отчёт', 'спорт', 'прочитать', 'книгу', 'убрать', 'кухню']
+NEEDLE = 'дедлайн'
+MATCHES = 20
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк поиска задач: замеряет задержку search_tasks у пользователя с растущим числом задач "
+            "(совпадений всегда одинаково) и проверяет, что она растёт сублинейно. "
+            "Всё выполняется в транзакции, которая в конце откатывается.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help="Число задач пользователя на каждом шаге")
+        parser.add_argument('--repeat', type=int, default=20, help="Сколько раз повторять запрос на шаге")
+        parser.add_argument('--max-exponent', type=float, default=0.5,
+                            help="Допустимый показатель роста: задержка ~ N^exponent")
+
+    def handle(self, *args, sizes, repeat, max_exponent, **options):
+        sizes = sorted(sizes)
+        timings = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create(email='search-bench@example.invalid', username='search-bench',
+                                           password=make_password(None))
+                seeded = 0
+                for size in sizes:
+                    self.seed(user, seeded, size)
+                    seeded = size
+                    timings[size] = self.measure(user, repeat)
+                    self.stdout.write(f"{size} задач: медиана {timings[size] * 1000:.2f} мс")
+                raise Rollback
+        except Rollback:
+            pass
+
+        first, last = sizes[0], sizes[-1]
+        if first == last:
+            return
+        exponent = math.log(max(timings[last], 1e-9) / max(timings[first], 1e-9)) / math.log(last / first)
+        self.stdout.write(f"Рост задержки: N^{exponent:.2f}")
+        if exponent > max_exponent:
+            raise CommandError(f"Задержка растёт как N^{exponent:.2f}, допустимо N^{max_exponent}")
+        self.stdout.write(self.style.SUCCESS("Задержка поиска растёт сублинейно"))
+
+    def seed(self, user, start, stop):
+        rows = (
+            Task(user=user, title=f'{FILLER[i % len(FILLER)]} {FILLER[(i * 7) % len(FILLER)]} {i}',
+                 description=' '.join(FILLER[(i + j) % len(FILLER)] for j in range(5)),
+                 reward_xp=5, reward_gold=10)
+            for i in range(start, stop)
+        )
+        while batch := list(islice(rows, 5000)):
+            Task.objects.bulk_create(batch)
+        # Совпадений столько же на каждом шаге: старые переименовываем, чтобы не накапливались
+        Task.objects.filter(user=user, title__contains=NEEDLE).update(title='архив')
+        for task in Task.objects.filter(user=user).order_by('?')[:MATCHES]:
+            task.title = f'{NEEDLE} {task.title}'
+            task.save(update_fields=['title'])
+
+    def measure(self, user, repeat):
+        ordering = TaskSearchPagination.ordering
+        page_size = TaskSearchPagination.page_size
+        visible = Task.objects.filter(
+            Q(user=user) | Q(id__in=TaskCollaborator.objects.filter(user=user, accepted=True).values('task_id'))
+        )
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            # Тот же запрос, что строит TaskViewSet.search для первой страницы
+            found = list(search_tasks(visible, NEEDLE, connection).order_by(*ordering)[:page_size + 1])
+            samples.append(time.perf_counter() - started)
+        if len(found) != min(MATCHES, page_size + 1):
+            raise CommandError(f"Найдено {len(found)} задач вместо {MATCHES}")
+        return statistics.median(samples)
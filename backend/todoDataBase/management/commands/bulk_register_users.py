@@ -0,0 +1,98 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from todoDataBase.catalog import provision_default_items
+from todoDataBase.models import User
+from todoDataBase.ranks import rank_for_xp
+from todoDataBase.task_io import detect_import_format, iter_import_rows
+
+
+class Command(BaseCommand):
+    help = ("Массовая регистрация пользователей из CSV/NDJSON (поля email, username, password) "
+            "пачками: bulk_create пользователей и дефолтных предметов. Без пароля аккаунт "
+            "создаётся с неиспользуемым паролем (вход после сброса пароля).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл .csv, .ndjson или .jsonl")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Сколько пользователей создавать одной транзакцией")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Процессов для хэширования паролей")
+
+    def handle(self, *args, path, batch_size, workers, **options):
+        with open(path, 'rb') as raw:
+            source = File(raw, name=path)
+            file_format = detect_import_format(source)
+            if file_format is None:
+                raise CommandError("Поддерживаются .csv, .ndjson и .jsonl")
+
+            self.created = self.skipped = 0
+            self.invalid = []
+            seen, batch = set(), []
+            # Хэширование пароля (PBKDF2) — основная стоимость регистрации, считаем его параллельно
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for number, row in iter_import_rows(source, file_format):
+                    user = self.build_user(number, row, seen)
+                    if user is not None:
+                        batch.append(user)
+                    if len(batch) >= batch_size:
+                        self.create_batch(batch, pool)
+                        batch = []
+                if batch:
+                    self.create_batch(batch, pool)
+
+        for number, error in self.invalid[:100]:
+            self.stderr.write(f"Строка {number}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {self.created}, пропущено (уже есть): {self.skipped}, с ошибками: {len(self.invalid)}"
+        ))
+
+    def build_user(self, number, row, seen):
+        if row is None:
+            self.invalid.append((number, "Строку не удалось разобрать"))
+            return None
+        email = User.objects.normalize_email(str(row.get('email') or '').strip())
+        try:
+            validate_email(email)
+        except ValidationError:
+            self.invalid.append((number, f"Неверный email: {email!r}"))
+            return None
+        if email in seen:
+            self.skipped += 1
+            return None
+        seen.add(email)
+
+        user = User(email=email, username=str(row.get('username') or '').strip()[:150])
+        user.raw_password = row.get('password') or None
+        return user
+
+    def create_batch(self, batch, pool):
+        for attempt in range(2):
+            existing = set(User.objects.filter(email__in=[user.email for user in batch]).values_list('email', flat=True))
+            fresh = [user for user in batch if user.email not in existing]
+            passwords = pool.map(make_password, [user.raw_password for user in fresh], chunksize=16)
+
+            rank = rank_for_xp(0)
+            for user, password in zip(fresh, passwords):
+                user.password = password
+                user.rank = rank
+            try:
+                with transaction.atomic():
+                    created = User.objects.bulk_create(fresh)
+                    provision_default_items(created)
+            except IntegrityError:
+                # Кто-то зарегистрировался с тем же email параллельно — пересчитываем существующих
+                if attempt:
+                    raise
+                continue
+            self.created += len(created)
+            self.skipped += len(batch) - len(fresh)
+            self.stdout.write(f"Создано: {self.created}")
+            return
@@ -0,0 +1,114 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from todoDataBase.models import (
+    User, Task, Inventory, FriendRequest, Friendship, TaskCollaborator, TaskTombstone,
+)
+from todoDataBase.search import search_users
+
+# Таблицы, которые растут вместе с пользователями: полный просмотр недопустим
+GUARDED_TABLES = {
+    model._meta.db_table for model in (
+        User, Task, Inventory, FriendRequest, Friendship, TaskCollaborator, TaskTombstone,
+    )
+}
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    # В SQLite полный просмотр — строка "SCAN <table>" без "USING ... INDEX"
+    'sqlite': re.compile(r'SCAN "?(\w+)"?(?!.*USING)'),
+}
+
+
+def hot_queries(user_id=1, other_id=2):
+    """
+    Запросы горячих эндпоинтов в том виде, в котором их строят views/serializers.
+    """
+    shared_task_ids = TaskCollaborator.objects.filter(user_id=user_id, accepted=True).values('task_id')
+    return {
+        'task_list_page': Task.objects.filter(
+            Q(user_id=user_id) | Q(id__in=shared_task_ids)
+        ).order_by('-updated_at', '-id')[:51],
+        'task_completed_count': Task.objects.filter(user_id=user_id, is_completed=True),
+        'task_reset_due': Task.objects.filter(
+            type=1, is_completed=True, completed_at__lt=timezone.now()
+        ).values('id')[:1000],
+        'task_tombstones_since': TaskTombstone.objects.filter(
+            user_id=user_id, deleted_at__gte=timezone.now()
+        ).values('task_id'),
+        'inventory_equipped': Inventory.objects.filter(user_id=user_id, is_equipped=True),
+        'collaborator_pending_invitations': TaskCollaborator.objects.filter(user_id=user_id, accepted=False),
+        'collaborator_shared_tasks': shared_task_ids,
+        'friendships_of_user': Friendship.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)),
+        'friendship_pair': Friendship.objects.filter(
+            Q(user1_id=user_id, user2_id=other_id) | Q(user1_id=other_id, user2_id=user_id)
+        ),
+        'friend_requests_all': FriendRequest.objects.filter(Q(from_user_id=user_id) | Q(to_user_id=user_id)),
+        'friend_requests_received': FriendRequest.objects.filter(to_user_id=user_id),
+        'friend_request_pair': FriendRequest.objects.filter(
+            Q(from_user_id=user_id, to_user_id=other_id) | Q(from_user_id=other_id, to_user_id=user_id)
+        ),
+        'leaderboard_page': User.objects.filter(is_active=True).filter(
+            Q(xp__lt=100) | Q(xp=100, id__gt=user_id)
+        ).order_by('-xp', 'id').values('id')[:51],
+        'leaderboard_position': User.objects.filter(is_active=True).filter(Q(xp__gt=100) | Q(xp=100, id__lt=user_id)).values('id'),
+        'user_search_page': search_users(
+            User.objects.exclude(id=user_id), 'alex', connection
+        ).order_by('-exact_match', 'search_key', 'id')[:21],
+    }
+
+
+@contextmanager
+def index_paths_only():
+    """
+    Транзакция для EXPLAIN. На пустой/маленькой базе Postgres всегда выбирает
+    Seq Scan — выключаем его, чтобы проверить, что путь через индекс вообще существует.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        yield
+
+
+def seq_scanned_tables(plan):
+    """Растущие таблицы, которые план читает целиком."""
+    pattern = SEQ_SCAN_PATTERNS[connection.vendor]
+    return sorted({table for table in pattern.findall(plan) if table in GUARDED_TABLES})
+
+
+class Command(BaseCommand):
+    help = "Проверяет планы (EXPLAIN) горячих запросов: падает, если какой-то из них читает таблицу целиком"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Сохранить планы в JSON-файл")
+
+    def handle(self, *args, output=None, **options):
+        if connection.vendor not in SEQ_SCAN_PATTERNS:
+            raise CommandError(f"Нет правил разбора планов для {connection.vendor}")
+
+        plans, failures = {}, []
+        with index_paths_only():
+            for name, queryset in hot_queries().items():
+                plan = queryset.explain()
+                plans[name] = plan
+                scanned = seq_scanned_tables(plan)
+                status = 'SEQ SCAN: ' + ', '.join(scanned) if scanned else 'ok'
+                self.stdout.write(f"{name}: {status}")
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+                if scanned:
+                    failures.append(name)
+
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(plans, f, ensure_ascii=False, indent=2)
+
+        if failures:
+            raise CommandError(f"Полный просмотр таблицы в запросах: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("Все горячие запросы используют индексы"))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todoDataBase.models import TaskTombstone, IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = ("Удаляет служебные записи старше срока хранения: отметки удаления задач для синхронизации "
+            "и ключи идемпотентности покупок")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=None,
+                            help="Запускать в цикле каждые N секунд (встроенный планировщик)")
+
+    def handle(self, *args, interval, **options):
+        while True:
+            purged = TaskTombstone.purge(timezone.now() - TaskTombstone.RETENTION)
+            self.stdout.write(f"Удалено устаревших отметок синхронизации: {purged}")
+
+            purged = IdempotencyRecord.purge(timezone.now() - IdempotencyRecord.RETENTION)
+            self.stdout.write(f"Удалено устаревших ключей идемпотентности: {purged}")
+
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from todoDataBase.stats import rebuild_stats, seed_history_from_tasks
+
+
+class Command(BaseCommand):
+    help = "Пересобирает дневную статистику задач (TaskStatsDaily) из истории TaskHistory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Сколько пользователей пересчитывать за одну транзакцию")
+        parser.add_argument('--seed-history', action='store_true',
+                            help="Сначала заполнить историю по выполненным задачам, у которых её нет")
+
+    def handle(self, *args, chunk_size, seed_history, **options):
+        if seed_history:
+            seeded = 0
+
+            def seeded_chunk(count):
+                nonlocal seeded
+                seeded += count
+                self.stdout.write(f"История: обработано задач {seeded}")
+
+            seed_history_from_tasks(chunk_size=chunk_size, on_chunk=seeded_chunk)
+
+        users = rows = 0
+
+        def rebuilt_chunk(user_count, row_count):
+            nonlocal users, rows
+            users += user_count
+            rows += row_count
+            self.stdout.write(f"Пользователей: {users}, дневных записей: {rows}")
+
+        rebuild_stats(chunk_size=chunk_size, on_chunk=rebuilt_chunk)
+        self.stdout.write(self.style.SUCCESS("Статистика пересобрана"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from todoDataBase.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает денормализованные счётчики пользователей (выполненные задачи, друзья, "
+            "входящие запросы) по исходным таблицам. Запускать при расхождениях: новые поля заполняет миграция 0034.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько пользователей сверять за одну транзакцию")
+
+    def handle(self, *args, chunk_size, **options):
+        checked = fixed = 0
+
+        def reconciled_chunk(user_count, fixed_count):
+            nonlocal checked, fixed
+            checked += user_count
+            fixed += fixed_count
+            self.stdout.write(f"Проверено: {checked}, исправлено: {fixed}")
+
+        reconcile_counters(chunk_size=chunk_size, on_chunk=reconciled_chunk)
+        self.stdout.write(self.style.SUCCESS("Счётчики сверены"))
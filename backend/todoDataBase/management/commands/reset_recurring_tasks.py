@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from todoDataBase.recurring import reset_expired_tasks
+
+
+class Command(BaseCommand):
+    help = "Сбрасывает выполненные Daily/Weekly задачи, у которых закончился период"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Сколько задач сбрасывать одним UPDATE")
+        parser.add_argument('--interval', type=int, default=None,
+                            help="Запускать в цикле каждые N секунд (встроенный планировщик)")
+
+    def handle(self, *args, chunk_size, interval, **options):
+        while True:
+            started = time.monotonic()
+            total = reset_expired_tasks(chunk_size=chunk_size)
+            self.stdout.write(f"Сброшено задач: {total} за {time.monotonic() - started:.2f} c")
+
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0020_task_collaboration_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='task_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0021_task_user_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='collaboration_type',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Любой может завершить'), (2, 'Все должны завершить')], default=1),
+        ),
+        migrations.AddField(
+            model_name='taskcollaborator',
+            name='completed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
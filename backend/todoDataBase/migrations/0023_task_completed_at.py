@@ -0,0 +1,31 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+def backfill_completed_at(apps, schema_editor):
+    # Для уже выполненных задач лучшая оценка момента выполнения — updated_at
+    Task = apps.get_model('todoDataBase', 'Task')
+    Task.objects.filter(is_completed=True, completed_at__isnull=True).update(
+        completed_at=models.F('updated_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0022_task_collaboration_type_taskcollaborator_completed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['type', 'completed_at'], name='task_reset_due_idx'),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0025_task_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['to_user', 'from_user'], name='friendrequest_to_from_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user2', 'user1'], name='friendship_user2_user1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('is_equipped', True)), fields=['user'], name='inventory_user_equipped_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['user'], name='task_user_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskcollaborator',
+            index=models.Index(fields=['user', 'accepted', 'task'], name='collab_user_accepted_idx'),
+        ),
+    ]
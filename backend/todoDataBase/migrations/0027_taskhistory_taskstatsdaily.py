@@ -0,0 +1,52 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0026_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStatsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('aborted', models.PositiveIntegerField(default=0)),
+                ('xp', models.IntegerField(default=0)),
+                ('gold', models.IntegerField(default=0)),
+                ('difficulty_1', models.PositiveIntegerField(default=0)),
+                ('difficulty_2', models.PositiveIntegerField(default=0)),
+                ('difficulty_3', models.PositiveIntegerField(default=0)),
+                ('difficulty_4', models.PositiveIntegerField(default=0)),
+                ('difficulty_5', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TaskHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.PositiveSmallIntegerField(choices=[(1, 'Completed'), (2, 'Aborted')])),
+                ('difficulty', models.PositiveSmallIntegerField(choices=[(1, 'Very Easy'), (2, 'Easy'), (3, 'Medium'), (4, 'Hard'), (5, 'Very Hard')])),
+                ('xp', models.IntegerField()),
+                ('gold', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('task', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='history', to='todoDataBase.task')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='taskhistory_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_rank(apps, schema_editor):
+    # То же, что backfill_user_ranks: старший ранг, на который хватает XP
+    Rank = apps.get_model('todoDataBase', 'Rank')
+    User = apps.get_model('todoDataBase', 'User')
+    ranks = Rank.objects.order_by('-required_xp', '-id')
+    if ranks:
+        User.objects.update(rank_id=models.Case(
+            *[models.When(xp__gte=rank.required_xp, then=models.Value(rank.id)) for rank in ranks],
+            default=models.Value(None),
+            output_field=models.IntegerField(),
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0027_taskhistory_taskstatsdaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rank',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='todoDataBase.rank'),
+        ),
+        migrations.RunPython(backfill_rank, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0028_user_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-xp', 'id'], name='user_xp_leaderboard_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_slots(apps, schema_editor):
+    Inventory = apps.get_model('todoDataBase', 'Inventory')
+    Inventory.objects.filter(item__type__in=['hair', 'headwear']).update(slot='hair')
+    for item_type in ('top', 'bottom', 'boots'):
+        Inventory.objects.filter(item__type=item_type).update(slot=item_type)
+
+    # Перед ограничением оставляем в каждом слоте только последний надетый предмет
+    keep = Inventory.objects.filter(is_equipped=True).values('user_id', 'slot').annotate(last_id=Max('id'))
+    Inventory.objects.filter(is_equipped=True).exclude(
+        id__in=[row['last_id'] for row in keep]
+    ).update(is_equipped=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0029_user_xp_leaderboard_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='slot',
+            field=models.CharField(default='', editable=False, max_length=20),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_slots, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='inventory',
+            name='inventory_user_equipped_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='inventory',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_equipped', True)), fields=('user', 'slot'), name='inventory_one_equipped_per_slot'),
+        ),
+    ]
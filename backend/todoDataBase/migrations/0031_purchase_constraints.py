@@ -0,0 +1,64 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def merge_duplicate_inventory(apps, schema_editor):
+    # Дубликаты от прежнего check-then-insert: оставляем первую запись,
+    # перенося на неё флаги остальных
+    Inventory = apps.get_model('todoDataBase', 'Inventory')
+    duplicates = Inventory.objects.values('user_id', 'item_id').annotate(
+        count=models.Count('id')
+    ).filter(count__gt=1)
+    for pair in duplicates:
+        rows = list(Inventory.objects.filter(user_id=pair['user_id'], item_id=pair['item_id']).order_by('id'))
+        keep, rest = rows[0], rows[1:]
+        equipped = any(row.is_equipped for row in rows)
+        Inventory.objects.filter(id__in=[row.id for row in rest]).delete()
+        Inventory.objects.filter(id=keep.id).update(
+            is_unlocked=any(row.is_unlocked for row in rows),
+            is_purchased=any(row.is_purchased for row in rows),
+            is_equipped=equipped,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0030_inventory_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('scope', models.CharField(max_length=100)),
+                ('status_code', models.PositiveSmallIntegerField(null=True)),
+                ('response', models.JSONField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(merge_duplicate_inventory, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='inventory',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='inventory_user_item_uniq'),
+        ),
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_records', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='idempotencyrecord',
+            index=models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencyrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='idempotency_user_key_uniq'),
+        ),
+    ]
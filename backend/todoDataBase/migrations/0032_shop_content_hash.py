@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+def rename_duplicate_items(apps, schema_editor):
+    # Одноимённые предметы (созданные в админке) получают суффикс с id,
+    # чтобы имя стало ключом синхронизации; покупки не затрагиваются
+    Shop = apps.get_model('todoDataBase', 'Shop')
+    duplicates = Shop.objects.values('name').annotate(count=models.Count('id')).filter(count__gt=1)
+    for row in duplicates:
+        for item in Shop.objects.filter(name=row['name']).order_by('id')[1:]:
+            item.name = f'{item.name[:90]} ({item.id})'
+            item.save(update_fields=['name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0031_purchase_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(rename_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shop',
+            constraint=models.UniqueConstraint(fields=('name',), name='shop_name_uniq'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from todoDataBase.search import install_user_search_index, uninstall_user_search_index
+
+
+def install(apps, schema_editor):
+    install_user_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_user_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0032_shop_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
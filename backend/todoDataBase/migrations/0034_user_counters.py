@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:33
+
+from django.db import migrations, models
+
+from todoDataBase.counters import reconcile_counters
+
+
+def fill_counters(apps, schema_editor):
+    # Те же пачки и подзапросы, что у reconcile_user_counters, но по историческим моделям
+    reconcile_counters(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0033_user_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='completed_tasks_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='friends_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pending_requests_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
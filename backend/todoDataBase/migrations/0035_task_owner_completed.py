@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todoDataBase', '0034_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='owner_completed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
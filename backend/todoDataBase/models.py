@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import BaseUserManager
 from django.conf import settings
-from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from django.db.models import Q, F, Value, Case, When
+from django.db.models.functions import Greatest
+from collections import defaultdict
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -26,6 +30,77 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def grant_rewards(self, user_ids, xp=0, gold=0):
+        """
+        Начисляет (или списывает, если значения отрицательные) XP и золото
+        одним UPDATE ... WHERE id IN (...). Арифметика выполняется в БД,
+        поэтому параллельные начисления не теряются. Баланс не уходит в минус.
+        """
+        def delta(field, amount):
+            if amount >= 0:
+                return F(field) + amount
+            return Greatest(F(field) - (-amount), Value(0))
+
+        from .character import invalidate_character  # Avoid circular import
+        self.filter(id__in=user_ids).update(xp=delta('xp', xp), gold=delta('gold', gold))
+        invalidate_character(*user_ids)
+        return self.sync_ranks(user_ids) if xp else {}
+
+    def grant_reward_map(self, rewards):
+        """
+        Начисляет разным пользователям разные суммы одним UPDATE с CASE.
+        rewards: {user_id: (xp, gold)}
+        """
+        if not rewards:
+            return {}
+
+        def delta(field, index):
+            return F(field) + Case(
+                *[When(id=user_id, then=Value(amounts[index])) for user_id, amounts in rewards.items()],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            )
+
+        from .character import invalidate_character  # Avoid circular import
+        self.filter(id__in=rewards.keys()).update(xp=delta('xp', 0), gold=delta('gold', 1))
+        invalidate_character(*rewards.keys())
+        return self.sync_ranks(rewards.keys())
+
+    def adjust_counters(self, field, deltas):
+        """
+        Сдвигает денормализованный счётчик (User.COUNTER_FIELDS) в БД.
+        deltas: {user_id: изменение}; один UPDATE на каждое различное
+        изменение, ниже нуля счётчик не опускается.
+        """
+        by_delta = defaultdict(list)
+        for user_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(user_id)
+        for delta, user_ids in by_delta.items():
+            value = F(field) + delta if delta > 0 else Greatest(F(field) - (-delta), Value(0))
+            self.filter(id__in=user_ids).update(**{field: value})
+
+    def sync_ranks(self, user_ids):
+        """
+        Приводит сохранённый ранг в соответствие с XP после начисления.
+        Возвращает {user_id: (старый rank_id, новый rank_id)} по изменившимся.
+        """
+        from .ranks import rank_for_xp  # Avoid circular import
+
+        changes = {}
+        for user_id, xp, rank_id in self.filter(id__in=user_ids).values_list('id', 'xp', 'rank_id'):
+            rank = rank_for_xp(xp)
+            new_rank_id = rank.id if rank else None
+            if new_rank_id != rank_id:
+                changes[user_id] = (rank_id, new_rank_id)
+
+        by_rank = defaultdict(list)
+        for user_id, (_, new_rank_id) in changes.items():
+            by_rank[new_rank_id].append(user_id)
+        for new_rank_id, ids in by_rank.items():
+            self.filter(id__in=ids).update(rank_id=new_rank_id)
+        return changes
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     username = models.CharField(max_length=150, blank=True)
@@ -36,11 +111,23 @@ class User(AbstractUser):
     avatar = models.ImageField(upload_to="avatars/", null=True, blank=True)
     gold = models.PositiveIntegerField(default=0)
     xp = models.PositiveIntegerField(default=0)
+    # Денормализованный ранг, следует за xp (см. sync_ranks и backfill_user_ranks)
+    rank = models.ForeignKey('Rank', on_delete=models.SET_NULL, null=True, blank=True, related_name='users')
+    # Денормализованные счётчики для экрана друзей: меняются в БД (adjust_counters)
+    # на тех же путях записи, сверяются командой reconcile_user_counters
+    completed_tasks_count = models.PositiveIntegerField(default=0, editable=False)
+    friends_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_requests_count = models.PositiveIntegerField(default=0, editable=False)
+    COUNTER_FIELDS = ('completed_tasks_count', 'friends_count', 'pending_requests_count')
 
     objects = CustomUserManager()
 
     class Meta:
         db_table = "auth_user"
+        indexes = [
+            # Таблица лидеров: ORDER BY xp DESC, id и подсчёт "кто выше меня"
+            models.Index(fields=['-xp', 'id'], name='user_xp_leaderboard_idx'),
+        ]
 
     def change_password(self, current_password, new_password):
         """
@@ -53,27 +140,48 @@ class User(AbstractUser):
             raise ValidationError("Пароль должен содержать минимум 6 символов")
         
         self.set_password(new_password)
-        self.save()
+        # Только пароль: полное сохранение вернуло бы xp/gold из памяти поверх параллельных F()-начислений
+        self.save(update_fields=['password'])
 
     def update_profile(self, name=None, email=None):
         """
         Обновление профиля пользователя
         """
+        update_fields = []
         if name is not None:
             self.username   = name
             # или self.username = name, в зависимости от вашей логики
+            update_fields.append('username')
             
         if email is not None:
             if User.objects.filter(email=email).exclude(id=self.id).exists():
                 raise ValidationError("Email уже используется другим пользователем")
             self.email = email
+            update_fields.append('email')
             
-        self.save()
+        self.save(update_fields=update_fields)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding:
+            # Счётчики в объекте могут быть устаревшими — полное сохранение их не перезаписывает
+            skipped = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped and field.name not in skipped
+            ]
+        if update_fields is None or 'xp' in update_fields:
+            from .ranks import rank_for_xp  # Avoid circular import
+            rank = rank_for_xp(self.xp)
+            self.rank_id = rank.id if rank else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'rank'}
+        super().save(*args, **kwargs)
 
     @property
     def current_rank(self):
-        from .models import Rank  # Avoid circular import
-        return Rank.objects.filter(required_xp__lte=self.xp).order_by('-required_xp').first()
+        from .ranks import rank_for_xp  # Avoid circular import
+        return rank_for_xp(self.xp)
     
 
 class Task(models.Model):
@@ -104,20 +212,60 @@ class Task(models.Model):
     reward_gold = models.PositiveIntegerField(editable=False)  # Calculated field
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # keyset-пагинация списка задач: WHERE user = ? ORDER BY updated_at DESC, id DESC
+            models.Index(fields=['user', '-updated_at', '-id'], name='task_user_updated_idx'),
+            # сброс Daily/Weekly задач (см. recurring.reset_expired_tasks)
+            models.Index(
+                fields=['type', 'completed_at'],
+                condition=Q(is_completed=True),
+                name='task_reset_due_idx',
+            ),
+            # число выполненных задач друга (FriendshipSerializer)
+            models.Index(fields=['user'], condition=Q(is_completed=True), name='task_user_done_idx'),
+        ]
+
+    DIFFICULTY_MULTIPLIER = {
+        1: 0.5,  # Very Easy - 50% of base
+        2: 0.75,  # Easy - 75% of base
+        3: 1.0,  # Medium - 100% of base
+        4: 1.5,  # Hard - 150% of base
+        5: 2.0  # Very Hard - 200% of base
+    }
+
+    def calculate_rewards(self):
+        # Calculate rewards based on difficulty (без обращения к БД — годится для bulk_create)
+        multiplier = self.DIFFICULTY_MULTIPLIER[self.difficulty]
+        self.reward_xp = int(self.base_reward_xp * multiplier)
+        self.reward_gold = int(self.base_reward_gold * multiplier)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        # Состояние в БД — для счётчика выполненных задач владельца (см. save)
+        task._saved_completed = task.__dict__.get('is_completed')
+        return task
 
     def save(self, *args, **kwargs):
-        # Calculate rewards based on difficulty before saving
-        difficulty_multiplier = {
-            1: 0.5,  # Very Easy - 50% of base
-            2: 0.75,  # Easy - 75% of base
-            3: 1.0,  # Medium - 100% of base
-            4: 1.5,  # Hard - 150% of base
-            5: 2.0  # Very Hard - 200% of base
-        }
-
-        self.reward_xp = int(self.base_reward_xp * difficulty_multiplier[self.difficulty])
-        self.reward_gold = int(self.base_reward_gold * difficulty_multiplier[self.difficulty])
-        super().save(*args, **kwargs)
+        self.calculate_rewards()
+
+        if not self.is_completed:
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
+
+        update_fields = kwargs.get('update_fields')
+        tracked = update_fields is None or 'is_completed' in update_fields
+        was_completed = False if self._state.adding else getattr(self, '_saved_completed', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if tracked and was_completed is not None and was_completed != self.is_completed:
+                User.objects.adjust_counters('completed_tasks_count', {self.user_id: 1 if self.is_completed else -1})
+        if tracked:
+            self._saved_completed = self.is_completed
 
     def delete(self, *args, **kwargs):
         # Handle deletion of the task
@@ -129,8 +277,8 @@ class Task(models.Model):
     
     def get_collaborators(self):
         return self.collaborators.filter(accepted=True)
-    
-        collaboration_type = models.PositiveSmallIntegerField(
+
+    collaboration_type = models.PositiveSmallIntegerField(
         choices=[(1, 'Любой может завершить'), (2, 'Все должны завершить')],
         default=1
     )
@@ -138,8 +286,83 @@ class Task(models.Model):
         choices=[(1, 'Ожидание'), (2, 'Принято'), (3, 'Отклонено')],
         default=1
     )
+    # "Все должны завершить": владелец уже отметился и ждёт коллабораторов
+    # (их отметки — TaskCollaborator.completed)
+    owner_completed = models.BooleanField(default=False, editable=False)
+
+
+class TaskTombstone(models.Model):
+    """
+    Отметка о том, что задача пропала из списка пользователя: удалена
+    или у него отозвали доступ коллаборатора. Нужна для дельта-синхронизации.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='task_tombstones')
+    task_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    # Курсоры старше этого срока требуют полной синхронизации
+    RETENTION = timedelta(days=30)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+    @classmethod
+    def purge(cls, before):
+        return cls.objects.filter(deleted_at__lt=before).delete()[0]
+
+
+class TaskHistory(models.Model):
+    """
+    Сырая история начислений по задачам: одна строка на участника за каждое
+    выполнение (или штраф за отмену). Из неё пересобирается TaskStatsDaily.
+    """
+    COMPLETED = 1
+    ABORTED = 2
+    EVENT_CHOICES = [
+        (COMPLETED, 'Completed'),
+        (ABORTED, 'Aborted'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='task_history')
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True, related_name='history')
+    event = models.PositiveSmallIntegerField(choices=EVENT_CHOICES)
+    difficulty = models.PositiveSmallIntegerField(choices=Task.DIFFICULTY_CHOICES)
+    xp = models.IntegerField()
+    gold = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='taskhistory_user_created_idx'),
+        ]
+
+
+class TaskStatsDaily(models.Model):
+    """
+    Дневная сводка по пользователю, обновляется инкрементально (см. stats.py).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='task_stats')
+    day = models.DateField()
+    completed = models.PositiveIntegerField(default=0)
+    aborted = models.PositiveIntegerField(default=0)
+    xp = models.IntegerField(default=0)
+    gold = models.IntegerField(default=0)
+    difficulty_1 = models.PositiveIntegerField(default=0)
+    difficulty_2 = models.PositiveIntegerField(default=0)
+    difficulty_3 = models.PositiveIntegerField(default=0)
+    difficulty_4 = models.PositiveIntegerField(default=0)
+    difficulty_5 = models.PositiveIntegerField(default=0)
+
+    COUNTERS = [
+        'completed', 'aborted', 'xp', 'gold',
+        'difficulty_1', 'difficulty_2', 'difficulty_3', 'difficulty_4', 'difficulty_5',
+    ]
+
+    class Meta:
+        unique_together = ("user", "day")
 
-        
 
 class Shop(models.Model):
     ITEM_TYPES = [
@@ -162,37 +385,79 @@ class Shop(models.Model):
     image_preview_url = models.URLField(blank=True, null=True)  # картинка для магазина
     image_character_url = models.URLField(blank=True, null=True)  # картинка для персонажа
     is_default = models.BooleanField(default=False)
+    # sha256 файла картинки: populate_shop.py обновляет только изменившиеся предметы
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            # Ключ синхронизации каталога (bulk_create с update_conflicts)
+            models.UniqueConstraint(fields=['name'], name='shop_name_uniq'),
+        ]
 
 
 class Inventory(models.Model):
+    # Слоты персонажа: hair и headwear занимают один слот
+    SLOTS = ['hair', 'top', 'bottom', 'boots']
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='inventory')
     item = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='in_inventory')
+    slot = models.CharField(max_length=20, editable=False)
     is_equipped = models.BooleanField(blank=False, default=False)
     is_unlocked = models.BooleanField(default=False)
     is_purchased = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # Не больше одного надетого предмета в слоте; заодно индекс для
+            # выборки экипированных предметов персонажа
+            models.UniqueConstraint(
+                fields=['user', 'slot'], condition=Q(is_equipped=True), name='inventory_one_equipped_per_slot'
+            ),
+            # Одна запись на предмет: покупка/разблокировка делают upsert
+            models.UniqueConstraint(fields=['user', 'item'], name='inventory_user_item_uniq'),
+        ]
+
+    @staticmethod
+    def slot_for(item_type):
+        return 'hair' if item_type in ('hair', 'headwear') else item_type
+
     def save(self, *args, **kwargs):
+        self.slot = self.slot_for(self.item.type)
         if self.is_equipped:
-            item_type = self.item.type
-
-            # Для hair/headwear обрабатываем как одну группу
-            if item_type in ['hair', 'headwear']:
-                Inventory.objects.filter(
-                    user=self.user,
-                    is_equipped=True
-                ).exclude(id=self.id).filter(
-                    models.Q(item__type='hair') | models.Q(item__type='headwear')
-                ).update(is_equipped=False)
-            else:
-                # Для других типов (top, bottom, boots) снимаем предметы того же типа
-                Inventory.objects.filter(
-                    user=self.user,
-                    is_equipped=True,
-                    item__type=item_type
-                ).exclude(id=self.id).update(is_equipped=False)
+            # Снимаем предмет, надетый в этом слоте
+            Inventory.objects.filter(
+                user_id=self.user_id, slot=self.slot, is_equipped=True
+            ).exclude(id=self.id).update(is_equipped=False)
 
         super().save(*args, **kwargs)
 
+class IdempotencyRecord(models.Model):
+    """
+    Сохранённый ответ на запрос с заголовком Idempotency-Key: повтор
+    того же запроса (ретрай клиента) получает тот же ответ без повторного списания.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=100)  # эндпоинт и объект, например shop.purchase:12
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    RETENTION = timedelta(days=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    @classmethod
+    def purge(cls, before):
+        return cls.objects.filter(created_at__lt=before).delete()[0]
+
+
 class Rank(models.Model):
     name = models.CharField(max_length=100)
     required_xp = models.PositiveIntegerField()
@@ -220,10 +485,34 @@ class FriendRequest(models.Model):
 
     class Meta:
         unique_together = ("from_user", "to_user")
+        indexes = [
+            # входящие запросы и обратная пара в OR-фильтрах
+            models.Index(fields=['to_user', 'from_user'], name='friendrequest_to_from_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_user.email} -> {self.to_user.email} ({'accepted' if self.accepted else 'pending'})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        friend_request = super().from_db(db, field_names, values)
+        # Состояние в БД — для счётчика входящих запросов получателя (см. save)
+        accepted = friend_request.__dict__.get('accepted')
+        friend_request._saved_pending = None if accepted is None else not accepted
+        return friend_request
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        tracked = update_fields is None or 'accepted' in update_fields
+        was_pending = False if self._state.adding else getattr(self, '_saved_pending', None)
+        pending = not self.accepted
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if tracked and was_pending is not None and was_pending != pending:
+                User.objects.adjust_counters('pending_requests_count', {self.to_user_id: 1 if pending else -1})
+        if tracked:
+            self._saved_pending = pending
+
 
 class Friendship(models.Model):
     user1 = models.ForeignKey(
@@ -240,10 +529,23 @@ class Friendship(models.Model):
 
     class Meta:
         unique_together = ("user1", "user2")
+        indexes = [
+            # Q(user1=u) | Q(user2=u) и обратная пара в are_friends
+            models.Index(fields=['user2', 'user1'], name='friendship_user2_user1_idx'),
+        ]
 
     def __str__(self):
         return f"Friendship: {self.user1.email} - {self.user2.email}"
 
+    def save(self, *args, **kwargs):
+        from .friends import invalidate_friends  # Avoid circular import
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                User.objects.adjust_counters('friends_count', {self.user1_id: 1, self.user2_id: 1})
+                invalidate_friends(self.user1_id, self.user2_id)
+
     @staticmethod
     def befriend(user1, user2):
         # гарантируем, что user1.id < user2.id (чтобы не дублировать пары)
@@ -253,19 +555,28 @@ class Friendship(models.Model):
     
     @classmethod
     def are_friends(cls, user1, user2):
-        return cls.objects.filter(
-            (Q(user1=user1, user2=user2) | Q(user1=user2, user2=user1))
-        ).exists()
+        return cls.are_friends_bulk(user1, [user2.id])[user2.id]
+
+    @classmethod
+    def are_friends_bulk(cls, user, ids, verify=False):
+        """{id: дружат ли} по кэшированному множеству друзей (см. friends.py)."""
+        from .friends import are_friends_bulk  # Avoid circular import
+        return are_friends_bulk(user.id, ids, verify=verify)
     
 class TaskCollaborator(models.Model):
     task = models.ForeignKey("Task", on_delete=models.CASCADE, related_name="collaborators")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     invited_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="invited_collaborators")
     accepted = models.BooleanField(default=False)
+    completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ("task", "user")
+        indexes = [
+            # задачи, где пользователь коллаборатор, и его приглашения (покрывающий)
+            models.Index(fields=['user', 'accepted', 'task'], name='collab_user_accepted_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} on {self.task.id} ({'accepted' if self.accepted else 'pending'})"
@@ -0,0 +1,168 @@
+import base64
+import json
+from datetime import timedelta
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) пагинация по набору полей ordering.
+    Курсор хранит значения полей последней строки страницы, поэтому
+    следующая страница выбирается по индексу без OFFSET и COUNT.
+    """
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        self.position = position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_position = self.get_position(rows[-1])
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def position_filter(self, position):
+        # (a, b) "после" (x, y)  <=>  a > x OR (a = x AND b > y), с учётом направления
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {f.lstrip('-'): position[j] for j, f in enumerate(self.ordering[:i])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[i]})
+        return condition
+
+    def encode_cursor(self, position):
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value
+                          for value in position])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [self.to_python(model, field.lstrip('-'), value)
+                    for field, value in zip(self.ordering, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # Аннотация (например, rank в поиске) — значение уже JSON-совместимо
+            return value
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+        return replace_query_param(url, self.page_size_query_param, self.page_size)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TaskCursorPagination(KeysetPagination):
+    ordering = ('-updated_at', '-id')
+
+
+class TaskSyncPagination(KeysetPagination):
+    """
+    Дельта-синхронизация: курсор since указывает на последнюю изменённую
+    задачу, которую клиент уже видел, и всегда возвращается в ответе.
+
+    updated_at проставляется приложением до COMMIT, поэтому транзакция может
+    стать видимой позже строк с большим updated_at. Курсор никогда не уходит
+    дальше now - safety_margin: строки моложе этой границы отдаются в конце
+    синхронизации, но приходят повторно в следующий раз (клиент делает upsert).
+    """
+    ordering = ('updated_at', 'id')
+    cursor_query_param = 'since'
+    page_size = 200
+    max_page_size = 500
+    # Дольше этого транзакция между проставлением updated_at и COMMIT не живёт
+    safety_margin = timedelta(seconds=10)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.horizon = timezone.now() - self.safety_margin
+        rows = super().paginate_queryset(queryset.filter(updated_at__lt=self.horizon), request, view)
+        if self.next_position is None and len(rows) < self.page_size:
+            # Устоявшиеся изменения кончились — добавляем свежие, не сдвигая за них курсор
+            rows += queryset.filter(updated_at__gte=self.horizon).order_by(
+                *self.ordering
+            )[:self.page_size - len(rows)]
+        return rows
+
+    def get_since(self):
+        return self.position[0] if self.position is not None else None
+
+    def get_sync_cursor(self):
+        if self.next_position is not None:
+            return self.encode_cursor(self.next_position)
+        # Всё до границы отдано; то, что после неё, следующая синхронизация пришлёт заново
+        return self.encode_cursor([self.horizon, 0])
+
+
+class TaskSearchPagination(KeysetPagination):
+    ordering = ('-rank', '-id')
+    page_size = 20
+    max_page_size = 100
+
+
+class LeaderboardPagination(KeysetPagination):
+    ordering = ('-xp', 'id')
+    page_size = 50
+    max_page_size = 100
+
+
+class UserSearchPagination(KeysetPagination):
+    # Точное совпадение email — первым, дальше по имени
+    ordering = ('-exact_match', 'search_key', 'id')
+    page_size = 20
+    max_page_size = 50
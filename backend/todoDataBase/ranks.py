@@ -0,0 +1,113 @@
+"""
+Кэш лестницы рангов в памяти процесса.
+
+Таблица рангов маленькая и почти не меняется, поэтому отсортированный список
+держится в процессе, а ранг по XP ищется bisect'ом без запросов к БД.
+Актуальность проверяется по версии в общем кэше Django (settings.CACHES):
+изменение Rank (сигналы в signals.py) записывает новую версию, и каждый
+процесс перечитывает лестницу. Версия сверяется не чаще раза в
+CHECK_INTERVAL секунд, а старше MAX_AGE лестница перечитывается в любом
+случае — на случай, если кэш окажется локальным для процесса.
+"""
+import bisect
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, When, Value, IntegerField
+
+VERSION_KEY = 'rank_ladder:version'
+CHECK_INTERVAL = 2
+MAX_AGE = 60
+
+_lock = threading.Lock()
+_ladder = None  # (версия, пороги XP, ранги)
+_checked_at = _loaded_at = 0.0
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен или ещё не создан: новая версия, а не 1, чтобы
+        # процесс со старой лестницей под версией 1 не счёл её актуальной
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _load():
+    from .models import Rank  # Avoid circular import
+    ranks = sorted(Rank.objects.all(), key=lambda rank: (rank.required_xp, rank.id))
+    return [rank.required_xp for rank in ranks], ranks
+
+
+def rank_ladder():
+    """Ранги по возрастанию required_xp."""
+    return _get()[2]
+
+
+def rank_for_xp(xp):
+    """Старший ранг, для которого хватает XP, или None."""
+    _, thresholds, ranks = _get()
+    index = bisect.bisect_right(thresholds, xp)
+    return ranks[index - 1] if index else None
+
+
+def next_rank_for_xp(xp):
+    """Ближайший ранг, до которого XP ещё не хватает, или None."""
+    _, thresholds, ranks = _get()
+    index = bisect.bisect_right(thresholds, xp)
+    return ranks[index] if index < len(ranks) else None
+
+
+def rank_by_id(rank_id):
+    for rank in rank_ladder():
+        if rank.id == rank_id:
+            return rank
+    return None
+
+
+def is_rank_up(old_rank_id, new_rank_id):
+    """Новый ранг выше старого по лестнице."""
+    if new_rank_id is None:
+        return False
+    positions = {rank.id: index for index, rank in enumerate(rank_ladder())}
+    return positions.get(new_rank_id, -1) > positions.get(old_rank_id, -1)
+
+
+def rank_case(field='xp'):
+    """
+    SQL-выражение "id старшего ранга, для которого хватает field" —
+    для пересчёта сохранённого ранга одним UPDATE.
+    """
+    return Case(
+        *[When(**{f'{field}__gte': rank.required_xp}, then=Value(rank.id)) for rank in reversed(rank_ladder())],
+        default=Value(None),
+        output_field=IntegerField(),
+    )
+
+
+def _get():
+    global _ladder, _checked_at, _loaded_at
+    ladder = _ladder
+    now = time.monotonic()
+    if ladder is not None and now - _checked_at < CHECK_INTERVAL:
+        return ladder
+    version = _current_version()
+    if ladder is None or ladder[0] != version or now - _loaded_at >= MAX_AGE:
+        with _lock:
+            ladder = _ladder
+            if ladder is None or ladder[0] != version or now - _loaded_at >= MAX_AGE:
+                ladder = _ladder = (version, *_load())
+                _loaded_at = now
+    _checked_at = now
+    return ladder
+
+
+def invalidate_rank_ladder():
+    global _ladder
+    _ladder = None
+    # Новая версия видна другим процессам только после коммита —
+    # иначе они могут перечитать ещё старые строки под новой версией
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), None))
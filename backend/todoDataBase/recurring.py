@@ -0,0 +1,53 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User, Task, TaskCollaborator
+
+DAILY = 1
+WEEKLY = 2
+
+
+def period_starts(now=None):
+    """
+    Начало текущего дня и текущей недели (с понедельника) в TIME_ZONE проекта.
+    Выполненная задача, завершённая раньше начала своего периода, считается просроченной.
+    """
+    local = timezone.localtime(now or timezone.now())
+    day_start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = day_start - timedelta(days=day_start.weekday())
+    return {DAILY: day_start, WEEKLY: week_start}
+
+
+def reset_expired_tasks(now=None, chunk_size=1000, on_chunk=None):
+    """
+    Сбрасывает выполненные Daily/Weekly задачи, у которых закончился период.
+
+    Работает пачками: каждая пачка — короткая транзакция из SELECT id по частичному
+    индексу task_reset_due_idx и UPDATE ... WHERE id IN (...), без save() по строкам.
+    Сброшенные задачи перестают подходить под условие, поэтому после падения
+    повторный запуск просто продолжает с того места, где остановился.
+    """
+    total = 0
+    for task_type, cutoff in period_starts(now).items():
+        expired = Task.objects.filter(type=task_type, is_completed=True, completed_at__lt=cutoff)
+        while True:
+            with transaction.atomic():
+                # Строки блокируются до конца транзакции: владельцы для счётчиков совпадают со сброшенными
+                rows = list(expired.select_for_update().values_list('id', 'user_id')[:chunk_size])
+                if not rows:
+                    break
+                ids = [task_id for task_id, _ in rows]
+                reset = Task.objects.filter(id__in=ids).update(
+                    is_completed=False, completed_at=None, updated_at=timezone.now()
+                )
+                TaskCollaborator.objects.filter(task_id__in=ids, completed=True).update(completed=False)
+                User.objects.adjust_counters('completed_tasks_count', {
+                    user_id: -count for user_id, count in Counter(user_id for _, user_id in rows).items()
+                })
+            total += reset
+            if on_chunk:
+                on_chunk(task_type, reset)
+    return total
@@ -0,0 +1,200 @@
+"""
+Полнотекстовый поиск по задачам и префиксный поиск пользователей.
+
+PostgreSQL: функциональный GIN-индекс по to_tsvector(title || description),
+запрос строится тем же выражением, чтобы планировщик использовал индекс.
+SQLite (локальный запуск): FTS5-таблица с внешним содержимым и триггерами.
+
+Пользователи ищутся по началу username или email: функциональные индексы
+по (lower(поле), id), запрос — диапазон [q, q + U+10FFFF) по тому же
+выражению. В PostgreSQL выражение с COLLATE "C", чтобы диапазон и
+ORDER BY шли по индексу при любой локали базы.
+"""
+import re
+
+from django.db.models import Q, Value, BooleanField, FloatField, IntegerField, CharField
+from django.db.models.expressions import RawSQL
+
+TASK_TABLE = '"todoDataBase_task"'
+FTS_TABLE = '"todoDataBase_task_fts"'
+
+# Выражение должно совпадать в индексе и в запросе
+PG_VECTOR = "to_tsvector('simple', coalesce({table}title, '') || ' ' || coalesce({table}description, ''))"
+
+PG_INSTALL = [
+    f"CREATE INDEX IF NOT EXISTS task_search_idx ON {TASK_TABLE} "
+    f"USING gin (({PG_VECTOR.format(table='')}))",
+]
+PG_UNINSTALL = [
+    "DROP INDEX IF EXISTS task_search_idx",
+]
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, description, content={TASK_TABLE}, content_rowid='id', tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON {TASK_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON {TASK_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title, description ON {TASK_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS task_fts_ai",
+    "DROP TRIGGER IF EXISTS task_fts_ad",
+    "DROP TRIGGER IF EXISTS task_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+SQLITE_TRIGGERS = {'task_fts_ai', 'task_fts_ad', 'task_fts_au'}
+
+
+def install_search_index(connection):
+    """
+    Создаёт индекс поиска (идемпотентно). В SQLite пересоздание таблицы
+    миграцией теряет триггеры — тогда они ставятся заново, а индекс перестраивается.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in PG_INSTALL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            missing = SQLITE_TRIGGERS - {row[0] for row in cursor.fetchall()}
+            if not missing:
+                return
+            for sql in SQLITE_INSTALL:
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_search_index(connection):
+    statements = {'postgresql': PG_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _fts5_query(query):
+    # Каждое слово — отдельная фраза в кавычках (без синтаксиса FTS5), последнее — префикс
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+
+def search_tasks(queryset, query, connection):
+    """
+    Фильтрует queryset задач по запросу и добавляет аннотацию rank
+    (больше — релевантнее). Возвращает пустой queryset для пустого запроса.
+    """
+    query = query.strip()
+    if connection.vendor == 'postgresql':
+        if not query:
+            return queryset.none()
+        vector = PG_VECTOR.format(table=f'{TASK_TABLE}.')
+        return queryset.filter(
+            RawSQL(f"{vector} @@ websearch_to_tsquery('simple', %s)", [query], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"ts_rank({vector}, websearch_to_tsquery('simple', %s))", [query],
+                        output_field=FloatField())
+        )
+
+    if connection.vendor == 'sqlite':
+        match = _fts5_query(query)
+        if match is None:
+            return queryset.none()
+        # bm25() отрицательный: чем меньше, тем релевантнее
+        return queryset.annotate(
+            rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {TASK_TABLE}.id",
+                [match],
+                output_field=FloatField(),
+            )
+        ).filter(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]))
+
+    # Прочие СУБД: без индекса
+    if not query:
+        return queryset.none()
+    return queryset.filter(
+        Q(title__icontains=query) | Q(description__icontains=query)
+    ).annotate(rank=Value(1.0, output_field=FloatField()))
+
+
+USER_TABLE = '"auth_user"'
+USER_SEARCH_FIELDS = ('username', 'email')
+# Сколько совпадений берётся из каждого индекса: поиск не сканирует весь префикс
+USER_SEARCH_LIMIT = 100
+USER_KEY = {
+    'postgresql': 'lower("{field}") COLLATE "C"',
+    # lower() в SQLite меняет регистр только у ASCII
+    'sqlite': 'lower("{field}")',
+}
+
+
+def install_user_search_index(connection):
+    template = USER_KEY.get(connection.vendor)
+    if template is None:
+        return
+    with connection.cursor() as cursor:
+        for field in USER_SEARCH_FIELDS:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS user_{field}_prefix_idx ON {USER_TABLE} "
+                f"(({template.format(field=field)}), id)"
+            )
+
+
+def uninstall_user_search_index(connection):
+    if connection.vendor not in USER_KEY:
+        return
+    with connection.cursor() as cursor:
+        for field in USER_SEARCH_FIELDS:
+            cursor.execute(f"DROP INDEX IF EXISTS user_{field}_prefix_idx")
+
+
+def _lower(query, connection):
+    if connection.vendor == 'sqlite':
+        return ''.join(char.lower() if char.isascii() else char for char in query)
+    return query.lower()
+
+
+def search_users(queryset, query, connection):
+    """
+    Пользователи, у которых username или email начинается с запроса
+    (без учёта регистра), не больше USER_SEARCH_LIMIT с каждого индекса.
+    Аннотации: exact_match (1 — email совпал целиком) и search_key
+    (username в нижнем регистре) — по ним сортирует UserSearchPagination.
+    """
+    query = query.strip()
+    template = USER_KEY.get(connection.vendor)
+    if not query or template is None:
+        # Пустой запрос или прочие СУБД (без индекса); аннотации нужны для сортировки
+        queryset = queryset.annotate(
+            exact_match=Value(0, output_field=IntegerField()),
+            search_key=Value('', output_field=CharField()),
+        )
+        if not query:
+            return queryset.none()
+        return queryset.filter(Q(username__istartswith=query) | Q(email__istartswith=query))
+
+    lowered = _lower(query, connection)
+    bounds = [lowered, lowered + '\U0010ffff']
+    # Без имени таблицы: в подзапросе Django даёт ей псевдоним, колонки берутся из ближайшего FROM
+    keys = {field: template.format(field=field) for field in USER_SEARCH_FIELDS}
+
+    matches = Q()
+    for field, key in keys.items():
+        # Диапазон по индексу с ORDER BY по нему же: читается не больше лимита строк
+        candidates = queryset.model.objects.filter(
+            RawSQL(f"{key} >= %s AND {key} < %s", bounds, output_field=BooleanField())
+        ).order_by(RawSQL(key, []).asc(), 'id').values('id')[:USER_SEARCH_LIMIT]
+        matches |= Q(id__in=candidates)
+
+    return queryset.filter(matches).annotate(
+        exact_match=RawSQL(f"CASE WHEN {keys['email']} = %s THEN 1 ELSE 0 END", [lowered],
+                           output_field=IntegerField()),
+        search_key=RawSQL(keys['username'], [], output_field=CharField()),
+    )
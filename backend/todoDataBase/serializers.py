@@ -7,8 +7,37 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 from django.db.models import Q
+from .ranks import rank_by_id
+from .sprite import sprite_url
+from .catalog import provision_default_items
 User = get_user_model()
 
+
+def resolve_friendship_statuses(user, other_ids):
+    """
+    Статусы отношений user с набором пользователей за два запроса
+    (вместо трёх exists() на каждого сериализуемого пользователя).
+    """
+    other_ids = set(other_ids)
+    statuses = dict.fromkeys(other_ids, 'can_add')
+    if not other_ids:
+        return statuses
+
+    for from_id, to_id in FriendRequest.objects.filter(
+        Q(from_user=user, to_user_id__in=other_ids) | Q(from_user_id__in=other_ids, to_user=user)
+    ).values_list('from_user_id', 'to_user_id'):
+        if from_id == user.id:
+            statuses[to_id] = 'request_sent'
+        elif statuses[from_id] == 'can_add':
+            statuses[from_id] = 'request_received'
+
+    for user1_id, user2_id in Friendship.objects.filter(
+        Q(user1=user, user2_id__in=other_ids) | Q(user1_id__in=other_ids, user2=user)
+    ).values_list('user1_id', 'user2_id'):
+        statuses[user2_id if user1_id == user.id else user1_id] = 'friend'
+
+    return statuses
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     email = serializers.EmailField(required=True)
     password = serializers.CharField(write_only=True, required=True)
@@ -62,30 +91,14 @@ class UserSerializer(serializers.ModelSerializer):
     def get_friendship_status(self, obj):
         request = self.context.get('request')
         if not request:
-            print("No request in context!!!") 
             return 'unknown'
-        
-        print(f"Checking friendship between {request.user.email} and {obj.email}")  # ← Отладочная информация
-        
-        # Проверяем, является ли пользователь другом
-        if Friendship.objects.filter(
-            Q(user1=request.user, user2=obj) | Q(user1=obj, user2=request.user)
-        ).exists():
-            print("Status: friend")  # ← Отладочная информация
-            return 'friend'
-        
-        # Проверяем, есть ли исходящий запрос
-        if FriendRequest.objects.filter(from_user=request.user, to_user=obj).exists():
-            print("Status: request_sent")  # ← Отладочная информация
-            return 'request_sent'
-        
-        # Проверяем, есть ли входящий запрос
-        if FriendRequest.objects.filter(from_user=obj, to_user=request.user).exists():
-            print("Status: request_received")  # ← Отладочная информация
-            return 'request_received'
-        
-        print("Status: can_add")  # ← Отладочная информация
-        return 'can_add'
+
+        # Статусы, заранее посчитанные для всей страницы (см. resolve_friendship_statuses)
+        statuses = self.context.get('friendship_statuses')
+        if statuses is None or obj.id not in statuses:
+            # Одиночный объект без подготовленного контекста
+            statuses = resolve_friendship_statuses(request.user, [obj.id])
+        return statuses[obj.id]
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -109,15 +122,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         }
 
     def give_default_items(self, user):
-        default_items = Shop.objects.filter(is_default=True)  # Filter by is_default instead
-        for item in default_items:
-            Inventory.objects.create(
-                user=user,
-                item=item,
-                is_equipped=True,
-                is_unlocked=True,
-                is_purchased=True
-            )
+        # Один INSERT по закэшированному списку дефолтных предметов
+        provision_default_items([user])
 
 
 class RankSerializer(serializers.ModelSerializer):
@@ -143,6 +149,20 @@ class ItemSerializer(serializers.ModelSerializer):
 
         
 
+class ShopListingSerializer(ItemSerializer):
+    """
+    Предмет магазина с состоянием для текущего пользователя; флаги
+    вычисляются аннотациями в ShopViewSet.personal.
+    """
+    is_unlocked = serializers.BooleanField(read_only=True)
+    is_purchased = serializers.BooleanField(read_only=True)
+    is_available = serializers.BooleanField(read_only=True)
+    is_affordable = serializers.BooleanField(read_only=True)
+
+    class Meta(ItemSerializer.Meta):
+        fields = ItemSerializer.Meta.fields + ['is_unlocked', 'is_purchased', 'is_available', 'is_affordable']
+
+
 class EquippedItemsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Shop
@@ -159,16 +179,32 @@ class InventorySerializer(serializers.ModelSerializer):
 
 class CharacterSerializer(serializers.ModelSerializer):
     equipped_items = serializers.SerializerMethodField()
-    inventory = InventorySerializer(many=True, source='inventory.all')
+    inventory = serializers.SerializerMethodField()
     rank = serializers.SerializerMethodField()
+    sprite_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'avatar', 'xp', 'gold', 'rank', 'equipped_items', 'inventory']
+        fields = ['id', 'username', 'email', 'avatar', 'xp', 'gold', 'rank', 'equipped_items', 'inventory', 'sprite_url']
+
+    def get_inventory_items(self, obj):
+        # character_inventory заполняется prefetch_character одним запросом
+        items = getattr(obj, 'character_inventory', None)
+        if items is None:
+            items = obj.inventory.select_related('item__required_rank').order_by('id')
+        return items
+
+    def get_inventory(self, obj):
+        return InventorySerializer(self.get_inventory_items(obj), many=True, context=self.context).data
 
     def get_equipped_items(self, obj):
-        equipped = obj.inventory.filter(is_equipped=True)
+        equipped = [entry for entry in self.get_inventory_items(obj) if entry.is_equipped]
         return InventorySerializer(equipped, many=True).data
+
+    def get_sprite_url(self, obj):
+        # Один собранный спрайт вместо отдельной картинки на каждый слой (см. sprite.py)
+        equipped = [entry.item for entry in self.get_inventory_items(obj) if entry.is_equipped]
+        return sprite_url(equipped, self.context.get('request'))
     
     def get_rank(self, obj):
         rank = obj.current_rank
@@ -186,6 +222,42 @@ class CharacterSerializer(serializers.ModelSerializer):
 
         
 
+class LoadoutSerializer(serializers.Serializer):
+    """
+    {слот: id записи инвентаря или null}; отсутствующие слоты не меняются.
+    """
+    hair = serializers.IntegerField(allow_null=True, required=False)
+    top = serializers.IntegerField(allow_null=True, required=False)
+    bottom = serializers.IntegerField(allow_null=True, required=False)
+    boots = serializers.IntegerField(allow_null=True, required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("Укажите хотя бы один слот")
+
+        user = self.context['request'].user
+        ids = [inventory_id for inventory_id in attrs.values() if inventory_id is not None]
+        entries = Inventory.objects.filter(user=user, id__in=ids).in_bulk()
+
+        chosen, errors = {}, {}
+        for slot, inventory_id in attrs.items():
+            if inventory_id is None:
+                chosen[slot] = None
+                continue
+            entry = entries.get(inventory_id)
+            if entry is None:
+                errors[slot] = "Предмет не найден в инвентаре"
+            elif not (entry.is_unlocked and entry.is_purchased):
+                errors[slot] = "Предмет не разблокирован или не куплен"
+            elif entry.slot != slot:
+                errors[slot] = f"Предмет надевается в слот {entry.slot}"
+            else:
+                chosen[slot] = entry
+        if errors:
+            raise serializers.ValidationError(errors)
+        return chosen
+
+
 class UserItemSerializer(serializers.ModelSerializer):
     item = ItemSerializer()
 
@@ -204,8 +276,18 @@ class TaskSerializer(serializers.ModelSerializer):
         read_only_fields = ('user',)
     
     def get_collaborators(self, obj):
-        collaborators = obj.collaborators.filter(accepted=True)
-        return TaskCollaboratorSerializer(collaborators, many=True).data
+        # accepted_collaborators заполняется Prefetch'ем в TaskViewSet
+        collaborators = getattr(obj, 'accepted_collaborators', None)
+        if collaborators is None:
+            collaborators = obj.collaborators.filter(accepted=True)
+        return TaskCollaboratorSerializer(collaborators, many=True, context=self.context).data
+
+class BulkCompleteSerializer(serializers.Serializer):
+    task_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
 
 #! FRIENDS SECTION ===========
 
@@ -230,28 +312,42 @@ class FriendshipSerializer(serializers.ModelSerializer):
     def get_friend(self, obj):
         request_user = self.context["request"].user
         friend = obj.user2 if obj.user1 == request_user else obj.user1
+        equipped = getattr(friend, 'equipped_inventory', None)
+        if equipped is None:
+            equipped = friend.inventory.filter(is_equipped=True).select_related('item')
         return {
             'id': friend.id,
             'username': friend.username,
             'email': friend.email,
             'avatar': friend.avatar.url if friend.avatar else None,
+            'sprite_url': sprite_url([entry.item for entry in equipped], self.context.get('request')),
         }
 
     def get_completed_tasks(self, obj):
-        from .models import Task
         request_user = self.context["request"].user
         friend = obj.user2 if obj.user1 == request_user else obj.user1
-        return Task.objects.filter(user=friend, is_completed=True).count()
+        # Денормализованный счётчик (см. User.COUNTER_FIELDS)
+        return friend.completed_tasks_count
 
     def get_rank(self, obj):
         request_user = self.context["request"].user
         friend = obj.user2 if obj.user1 == request_user else obj.user1
-        if friend.current_rank:
-            return {
-                'id': friend.current_rank.id,
-                'name': friend.current_rank.name,
-            }
-        return None
+        # Сохранённый ранг + лестница из кэша — без запросов на строку
+        rank = rank_by_id(friend.rank_id)
+        return {'id': rank.id, 'name': rank.name} if rank else None
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    rank = serializers.SerializerMethodField()
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'avatar', 'xp', 'rank']
+
+    def get_rank(self, obj):
+        # Сохранённый ранг + лестница из кэша — без запросов на строку
+        rank = rank_by_id(obj.rank_id)
+        return {'id': rank.id, 'name': rank.name} if rank else None
 
 
 class TaskCollaboratorSerializer(serializers.ModelSerializer):
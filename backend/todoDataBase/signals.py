@@ -0,0 +1,108 @@
+import weakref
+
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.signals import pre_delete, post_delete, post_save, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import User, Task, TaskCollaborator, TaskTombstone, Rank, Inventory, Shop, Friendship, FriendRequest
+from .catalog import bump_catalog_version
+from .character import invalidate_character
+from .friends import invalidate_friends
+from .ranks import invalidate_rank_ladder
+from .search import install_search_index, install_user_search_index
+
+
+# id пользователей, удаляемых одним User.objects.filter(...).delete(). pre_delete
+# приходит для всех удаляемых строк до первого удаления, поэтому к post_delete
+# зависимых строк набор уже полон и не зависит от того, что удалено каскадом
+_deleted_user_ids = weakref.WeakKeyDictionary()
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, QuerySet):
+        _deleted_user_ids.setdefault(origin, set()).add(instance.pk)
+
+
+def _user_is_deleted(origin, user_id):
+    # При удалении самого пользователя надгробия ему не нужны (и нарушили бы FK)
+    if isinstance(origin, User):
+        return origin.pk == user_id
+    return isinstance(origin, QuerySet) and user_id in _deleted_user_ids.get(origin, ())
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, origin=None, **kwargs):
+    if not _user_is_deleted(origin, instance.user_id):
+        TaskTombstone.objects.create(user_id=instance.user_id, task_id=instance.id)
+
+
+# Удаления (в том числе каскадные и queryset.delete()) уменьшают счётчики
+# пользователя внутри транзакции удаления; создание учитывают save() моделей
+@receiver(post_delete, sender=Task)
+def completed_task_deleted(sender, instance, origin=None, **kwargs):
+    if instance.is_completed and not _user_is_deleted(origin, instance.user_id):
+        User.objects.adjust_counters('completed_tasks_count', {instance.user_id: -1})
+
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender, instance, origin=None, **kwargs):
+    User.objects.adjust_counters('friends_count', {
+        user_id: -1 for user_id in (instance.user1_id, instance.user2_id) if not _user_is_deleted(origin, user_id)
+    })
+    invalidate_friends(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_delete, sender=FriendRequest)
+def friend_request_deleted(sender, instance, origin=None, **kwargs):
+    if not instance.accepted and not _user_is_deleted(origin, instance.to_user_id):
+        User.objects.adjust_counters('pending_requests_count', {instance.to_user_id: -1})
+
+
+@receiver(post_delete, sender=TaskCollaborator)
+def collaborator_removed(sender, instance, origin=None, **kwargs):
+    if instance.accepted and not _user_is_deleted(origin, instance.user_id):
+        TaskTombstone.objects.create(user_id=instance.user_id, task_id=instance.task_id)
+    # Список коллабораторов входит в задачу — она изменилась и для владельца
+    Task.objects.filter(id=instance.task_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=TaskCollaborator)
+def collaborator_saved(sender, instance, **kwargs):
+    Task.objects.filter(id=instance.task_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Rank)
+@receiver(post_delete, sender=Rank)
+def rank_changed(sender, **kwargs):
+    invalidate_rank_ladder()
+    # Ранг входит в каталог (required_rank у предметов)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def shop_item_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def inventory_changed(sender, instance, **kwargs):
+    invalidate_character(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Золото, XP, аватар и имя входят в данные персонажа
+    invalidate_character(instance.id)
+
+
+@receiver(post_migrate)
+def search_index_installed(sender, using, **kwargs):
+    # В SQLite пересоздание таблицы миграцией удаляет FTS-триггеры и индексы по выражениям
+    if sender.name == 'todoDataBase':
+        install_search_index(connections[using])
+        install_user_search_index(connections[using])
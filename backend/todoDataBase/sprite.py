@@ -0,0 +1,127 @@
+"""
+Серверная сборка спрайта персонажа из слоёв надетых предметов.
+
+Спрайт адресуется по содержимому: хэш от версии раскладки, id предметов и
+их image_character_url. Готовый файл лежит на диске под этим хэшем и
+отдаётся с immutable-заголовками — новая экипировка даёт новый URL.
+В URL передаются и id предметов, чтобы файл можно было пересобрать после
+очистки кэша или на другом инстансе. Собираются только наборы, которые
+сейчас надеты у какого-нибудь пользователя, — произвольными сочетаниями
+предметов кэш на диске не заполнить.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from urllib.parse import urlparse
+
+from django.conf import settings
+from PIL import Image
+
+# Раскладка экрана профиля (layerOffsets в profile.jsx): слот -> (x, y, ширина, высота)
+# в точках контейнера 200×300; слои вписываются в прямоугольник с сохранением пропорций
+LAYOUT = {
+    'boots': (30, 220, 140, 75),
+    'bottom': (30, 150, 140, 120),
+    'top': (0, 40, 200, 180),
+    'hair': (10, -90, 160, 300),
+}
+LAYER_ORDER = ['boots', 'bottom', 'top', 'hair']  # снизу вверх (zIndex)
+LAYOUT_VERSION = 1
+SCALE = 2
+
+# Холст охватывает все прямоугольники (причёска выходит выше контейнера)
+ORIGIN = (min(box[0] for box in LAYOUT.values()), min(box[1] for box in LAYOUT.values()))
+CANVAS = (
+    max(box[0] + box[2] for box in LAYOUT.values()) - ORIGIN[0],
+    max(box[1] + box[3] for box in LAYOUT.values()) - ORIGIN[1],
+)
+
+FORMATS = {
+    'png': ('PNG', 'image/png', {'optimize': True}),
+    'webp': ('WEBP', 'image/webp', {'quality': 90, 'method': 6}),
+}
+
+
+def cache_dir():
+    return getattr(settings, 'SPRITE_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'sprites'))
+
+
+def sprite_key(items):
+    """Хэш набора слоёв; items — предметы магазина (Shop)."""
+    digest = hashlib.sha256(f'v{LAYOUT_VERSION}'.encode())
+    for item in sorted(items, key=lambda item: item.id):
+        digest.update(f'|{item.id}:{item.image_character_url or ""}'.encode())
+    return digest.hexdigest()
+
+
+def sprite_path(key, ext):
+    return os.path.join(cache_dir(), key[:2], f'{key}.{ext}')
+
+
+def sprite_url(items, request=None, ext='png'):
+    items = list(items)
+    if not items:
+        return None
+    ids = ','.join(str(item.id) for item in sorted(items, key=lambda item: item.id))
+    url = f'/api/character/sprites/{sprite_key(items)}.{ext}?items={ids}'
+    return request.build_absolute_uri(url) if request else url
+
+
+def layer_file(url):
+    """Локальный файл слоя по его media-URL; внешние адреса не скачиваем."""
+    if not url:
+        return None
+    path = urlparse(url).path
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    root = os.path.realpath(settings.MEDIA_ROOT)
+    full_path = os.path.realpath(os.path.join(root, path[len(settings.MEDIA_URL):]))
+    if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+
+def render(items, ext):
+    canvas = Image.new('RGBA', (CANVAS[0] * SCALE, CANVAS[1] * SCALE), (0, 0, 0, 0))
+    by_slot = {}
+    for item in items:
+        by_slot['hair' if item.type in ('hair', 'headwear') else item.type] = item
+
+    for slot in LAYER_ORDER:
+        item = by_slot.get(slot)
+        path = layer_file(item.image_character_url) if item else None
+        if path is None:
+            continue
+        x, y, width, height = (value * SCALE for value in LAYOUT[slot])
+        with Image.open(path) as layer:
+            layer = layer.convert('RGBA')
+            # resizeMode: 'contain'
+            ratio = min(width / layer.width, height / layer.height)
+            size = (max(1, round(layer.width * ratio)), max(1, round(layer.height * ratio)))
+            layer = layer.resize(size, Image.LANCZOS)
+            left = x - ORIGIN[0] * SCALE + (width - size[0]) // 2
+            top = y - ORIGIN[1] * SCALE + (height - size[1]) // 2
+            canvas.alpha_composite(layer, (left, top))
+
+    pil_format, _, options = FORMATS[ext]
+    buffer = io.BytesIO()
+    canvas.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def get_or_render(key, items, ext):
+    """
+    Путь к готовому спрайту; при промахе собирает и атомарно записывает файл
+    (параллельные сборки одного ключа дают одинаковый результат).
+    """
+    path = sprite_path(key, ext)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = render(items, ext)
+        # Свой временный файл на каждую сборку: потоки одного процесса не пишут в один файл
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as file:
+            file.write(content)
+        os.chmod(file.name, 0o644)  # mkstemp создаёт файл только для владельца
+        os.replace(file.name, path)
+    return path
@@ -0,0 +1,153 @@
+"""
+Статистика выполнения задач: сырая история (TaskHistory) и дневные сводки
+(TaskStatsDaily), которые обновляются инкрементально на тех же путях записи,
+что и награды, и пересобираются из истории командой rebuild_task_stats.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, Count, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import User, Task, TaskHistory, TaskStatsDaily
+
+# Счётчики, которые не могут уйти в минус (xp/gold могут — штрафы за отмену)
+NON_NEGATIVE = {name for name in TaskStatsDaily.COUNTERS if name not in ('xp', 'gold')}
+
+
+def _deltas(rows, sign=1):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        counters = deltas[(row.user_id, timezone.localdate(row.created_at))]
+        if row.event == TaskHistory.COMPLETED:
+            counters['completed'] += sign
+            counters[f'difficulty_{row.difficulty}'] += sign
+        else:
+            counters['aborted'] += sign
+        counters['xp'] += sign * row.xp
+        counters['gold'] += sign * row.gold
+    return deltas
+
+
+def apply_deltas(deltas):
+    """
+    Применяет {(user_id, day): {счётчик: изменение}} к сводкам:
+    на каждый день один INSERT ... ON CONFLICT DO NOTHING и один UPDATE с CASE.
+    """
+    by_day = defaultdict(dict)
+    for (user_id, day), counters in deltas.items():
+        by_day[day][user_id] = counters
+
+    for day, users in by_day.items():
+        TaskStatsDaily.objects.bulk_create(
+            [TaskStatsDaily(user_id=user_id, day=day) for user_id in users],
+            ignore_conflicts=True,
+        )
+        updates = {}
+        for name in {name for counters in users.values() for name in counters}:
+            value = F(name) + Case(
+                *[When(user_id=user_id, then=Value(counters[name]))
+                  for user_id, counters in users.items() if counters.get(name)],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            updates[name] = Greatest(value, Value(0)) if name in NON_NEGATIVE else value
+        TaskStatsDaily.objects.filter(day=day, user_id__in=users).update(**updates)
+
+
+def record_completions(tasks, participants, when):
+    """
+    tasks — только что выполненные задачи, participants — {task_id: {user_id, ...}}.
+    """
+    rows = TaskHistory.objects.bulk_create([
+        TaskHistory(
+            user_id=user_id, task=task, event=TaskHistory.COMPLETED, difficulty=task.difficulty,
+            xp=task.reward_xp, gold=task.reward_gold, created_at=when,
+        )
+        for task in tasks for user_id in participants[task.id]
+    ])
+    apply_deltas(_deltas(rows))
+
+
+def record_uncompletion(task, user):
+    # Отмена возвращает награду только самому пользователю — и из истории убираем только его запись
+    row = TaskHistory.objects.filter(
+        task=task, user=user, event=TaskHistory.COMPLETED
+    ).order_by('-created_at').first()
+    if row is not None:
+        row.delete()
+        apply_deltas(_deltas([row], sign=-1))
+
+
+def record_abort(task, user, when=None):
+    row = TaskHistory.objects.create(
+        user=user, task=task, event=TaskHistory.ABORTED, difficulty=task.difficulty,
+        xp=-2 * task.reward_xp, gold=-2 * task.reward_gold, created_at=when or timezone.now(),
+    )
+    apply_deltas(_deltas([row]))
+
+
+def rebuild_stats(chunk_size=500, on_chunk=None):
+    """
+    Пересчитывает сводки из TaskHistory пачками пользователей (keyset по id),
+    каждая пачка — отдельная транзакция.
+    """
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not user_ids:
+            return
+        last_id = user_ids[-1]
+
+        stats = {}
+        aggregated = TaskHistory.objects.filter(user_id__in=user_ids).annotate(
+            day=TruncDate('created_at')
+        ).values('user_id', 'day', 'event', 'difficulty').annotate(
+            count=Count('id'), xp_sum=Sum('xp'), gold_sum=Sum('gold')
+        ).order_by()
+        for row in aggregated:
+            key = (row['user_id'], row['day'])
+            if key not in stats:
+                stats[key] = TaskStatsDaily(user_id=row['user_id'], day=row['day'])
+            item = stats[key]
+            if row['event'] == TaskHistory.COMPLETED:
+                item.completed += row['count']
+                name = f"difficulty_{row['difficulty']}"
+                setattr(item, name, getattr(item, name) + row['count'])
+            else:
+                item.aborted += row['count']
+            item.xp += row['xp_sum']
+            item.gold += row['gold_sum']
+
+        with transaction.atomic():
+            TaskStatsDaily.objects.filter(user_id__in=user_ids).delete()
+            TaskStatsDaily.objects.bulk_create(stats.values(), batch_size=1000)
+        if on_chunk:
+            on_chunk(len(user_ids), len(stats))
+
+
+def seed_history_from_tasks(chunk_size=1000, on_chunk=None):
+    """
+    Заполняет историю по уже выполненным задачам, у которых её ещё нет
+    (данные, появившиеся до TaskHistory): владелец и принятые коллабораторы.
+    """
+    last_id = 0
+    while True:
+        tasks = list(Task.objects.filter(
+            id__gt=last_id, is_completed=True, history__isnull=True
+        ).order_by('id').prefetch_related('collaborators')[:chunk_size])
+        if not tasks:
+            return
+        last_id = tasks[-1].id
+
+        TaskHistory.objects.bulk_create([
+            TaskHistory(
+                user_id=user_id, task=task, event=TaskHistory.COMPLETED, difficulty=task.difficulty,
+                xp=task.reward_xp, gold=task.reward_gold, created_at=task.completed_at or task.updated_at,
+            )
+            for task in tasks
+            for user_id in {task.user_id, *(c.user_id for c in task.collaborators.all() if c.accepted)}
+        ])
+        if on_chunk:
+            on_chunk(len(tasks))
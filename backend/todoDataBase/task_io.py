@@ -0,0 +1,250 @@
+"""
+Потоковый импорт и экспорт задач: файл читается и пишется построчно,
+поэтому память не зависит от его размера. В экспорт входит и история
+начислений (TaskHistory), включая штрафы за удалённые задачи.
+"""
+import csv
+import io
+import itertools
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Task, TaskHistory
+
+IMPORT_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+EXPORT_FIELDS = [
+    'id', 'title', 'description', 'difficulty', 'type', 'owner',
+    'is_completed', 'completed_at', 'due_date', 'reward_xp', 'reward_gold',
+    'created_at', 'updated_at', 'collaborators',
+]
+HISTORY_RECORD = 'history'
+HISTORY_FIELDS = ['id', 'event', 'task_id', 'difficulty', 'xp', 'gold', 'created_at']
+HISTORY_EVENTS = {TaskHistory.COMPLETED: 'completed', TaskHistory.ABORTED: 'aborted'}
+
+
+def detect_import_format(uploaded_file, requested=None):
+    if requested:
+        return requested if requested in IMPORT_FORMATS.values() else None
+    extension = os.path.splitext(uploaded_file.name or '')[1].lower()
+    return IMPORT_FORMATS.get(extension)
+
+
+def iter_import_rows(uploaded_file, file_format):
+    """
+    Отдаёт (номер строки, dict) по одной строке файла; None вместо dict — строку не разобрать.
+    """
+    text = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        # Строка 1 — заголовок
+        yield from enumerate(csv.DictReader(text), start=2)
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def _choice(value, choices, default, field, errors):
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = None
+    if value not in dict(choices):
+        errors[field] = f"Допустимые значения: {', '.join(str(key) for key, _ in choices)}"
+    return value
+
+
+def build_task(user, row):
+    """
+    Проверяет строку импорта и собирает несохранённую задачу с уже
+    посчитанными наградами. Возвращает (task, None) или (None, errors).
+    """
+    errors = {}
+
+    title = str(row.get('title') or '').strip()
+    if not title:
+        errors['title'] = "Обязательное поле"
+    elif len(title) > Task._meta.get_field('title').max_length:
+        errors['title'] = "Слишком длинное название"
+
+    difficulty = _choice(row.get('difficulty'), Task.DIFFICULTY_CHOICES, 3, 'difficulty', errors)
+    task_type = _choice(row.get('type'), Task.TYPE_CHOICES, 3, 'type', errors)
+
+    due_date = row.get('due_date') or None
+    if due_date is not None:
+        try:
+            parsed = parse_datetime(str(due_date))
+        except ValueError:
+            # Формат верный, но такой даты нет (например, 13-й месяц)
+            parsed = None
+        if parsed is None:
+            errors['due_date'] = "Ожидается дата в формате ISO 8601"
+        elif timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        due_date = parsed
+
+    if errors:
+        return None, errors
+
+    task = Task(
+        user=user,
+        title=title,
+        description=str(row.get('description') or ''),
+        difficulty=difficulty,
+        type=task_type,
+        due_date=due_date,
+    )
+    task.calculate_rewards()
+    return task, None
+
+
+def import_tasks(user, uploaded_file, file_format, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Импортирует задачи пачками через bulk_create. Некорректные строки
+    пропускаются и попадают в отчёт (первые MAX_REPORTED_ERRORS).
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+
+    def fail(number, errors):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': number, 'errors': errors})
+
+    def flush():
+        with transaction.atomic():
+            Task.objects.bulk_create(batch)
+        report['imported'] += len(batch)
+        batch.clear()
+
+    try:
+        for number, row in iter_import_rows(uploaded_file, file_format):
+            if row is not None and row.get('record') == HISTORY_RECORD:
+                # История начислений из NDJSON-экспорта не импортируется
+                continue
+            if row is None:
+                fail(number, {'non_field_errors': "Не удалось разобрать строку"})
+                continue
+
+            task, errors = build_task(user, row)
+            if errors:
+                fail(number, errors)
+                continue
+
+            batch.append(task)
+            if len(batch) >= chunk_size:
+                flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        fail(None, {'non_field_errors': f"Файл не читается дальше: {e}"})
+
+    if batch:
+        flush()
+    return report
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Строки выгрузки по одной задаче. iterator() читает задачи серверным
+    курсором пачками по chunk_size, prefetch коллабораторов идёт на каждую пачку.
+    Начисления по задачам — отдельно, в export_history_rows.
+    """
+    for task in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': task.id,
+            'title': task.title,
+            'description': task.description,
+            'difficulty': task.difficulty,
+            'type': task.type,
+            'owner': task.user.email,
+            'is_completed': task.is_completed,
+            'completed_at': task.completed_at,
+            'due_date': task.due_date,
+            'reward_xp': task.reward_xp,
+            'reward_gold': task.reward_gold,
+            'created_at': task.created_at,
+            'updated_at': task.updated_at,
+            'collaborators': [
+                {
+                    'id': collaborator.user_id,
+                    'email': collaborator.user.email,
+                    'username': collaborator.user.username,
+                    'completed': collaborator.completed,
+                }
+                for collaborator in task.accepted_collaborators
+            ],
+        }
+
+
+def export_history_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Строки истории начислений: выполнения и штрафы за отмену, в том числе
+    по уже удалённым задачам (task_id у них пустой).
+    """
+    for entry in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'record': HISTORY_RECORD,
+            'id': entry.id,
+            'event': HISTORY_EVENTS[entry.event],
+            'task_id': entry.task_id,
+            'difficulty': entry.difficulty,
+            'xp': entry.xp,
+            'gold': entry.gold,
+            'created_at': entry.created_at,
+        }
+
+
+def export_ndjson(tasks, history):
+    # Сначала задачи, затем история с "record": "history" — импорт её пропускает
+    for row in itertools.chain(export_rows(tasks), export_history_rows(history)):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # csv.writer пишет строку сюда и сразу получает её обратно — без буфера на весь файл
+    def write(self, value):
+        return value
+
+
+def _csv_rows(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in (row[field] for field in fields)
+        ])
+
+
+def export_csv(tasks, history):
+    # В CSV одна таблица: задачи; история — отдельным файлом (export_history_csv)
+    def rows():
+        for row in export_rows(tasks):
+            row['collaborators'] = ';'.join(collaborator['email'] for collaborator in row['collaborators'])
+            yield row
+    return _csv_rows(EXPORT_FIELDS, rows())
+
+
+def export_history_csv(tasks, history):
+    return _csv_rows(HISTORY_FIELDS, export_history_rows(history))
+
+
+EXPORTERS = {
+    'ndjson': ('application/x-ndjson', export_ndjson),
+    'csv': ('text/csv; charset=utf-8', export_csv),
+    'history_csv': ('text/csv; charset=utf-8', export_history_csv),
+}
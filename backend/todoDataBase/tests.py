@@ -1,4 +1,877 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 
+from . import friends, ranks, sprite
+from .models import (
+    FriendRequest, Friendship, IdempotencyRecord, Inventory, Rank, Shop, Task, TaskCollaborator, TaskTombstone, User,
+)
+from .catalog import bump_catalog_version
+from .counters import reconcile_counters
+from .management.commands.check_query_plans import hot_queries, index_paths_only, seq_scanned_tables
+from .pagination import TaskSyncPagination
+from .recurring import DAILY, WEEKLY, reset_expired_tasks
+
+
+def client_for(user, **kwargs):
+    client = APIClient(**kwargs)
+    client.force_authenticate(User.objects.get(id=user.id))
+    return client
+
+
+def post_with_retry(user, url, data=None, attempts=20, **extra):
+    """
+    POST из рабочего потока. Ошибку запроса получаем ответом 500, а не исключением:
+    тестовый клиент ловит исключения глобальным сигналом и поднял бы чужую ошибку.
+    На SQLite 500 — "database is locked" от гонки писателей; запрос откатился, повторяем.
+    """
+    client = client_for(user, raise_request_exception=False)
+    for _ in range(attempts):
+        response = client.post(url, data, format='json', **extra)
+        if response.status_code != 500:
+            return response
+    raise AssertionError(f'{url}: {response.status_code} after {attempts} attempts')
+
+
+def run_threads(target, args_list):
+    errors = []
+
+    def worker(*args):
+        try:
+            target(*args)
+        except Exception as error:  # noqa: BLE001 — проверяется в тесте
+            errors.append(error)
+        finally:
+            close_old_connections()
+
+    threads = [threading.Thread(target=worker, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def make_users(count, prefix='user', password=None):
+    # Без пароля — без PBKDF2, который заметно замедляет тесты
+    return [
+        User.objects.create_user(email=f'{prefix}{i}@test.io', username=f'{prefix}{i}', password=password)
+        for i in range(count)
+    ]
+
+
+# Считаем только запросы приложения: обращения DatabaseCache к своей таблице не в счёт
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class QueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context), response
+
+
+class ConcurrentTestCase(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class SharedTaskCompletionTests(ConcurrentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(email='owner@test.io', username='owner', password='x')
+        self.member = User.objects.create_user(email='member@test.io', username='member', password='x')
+
+    def make_shared_task(self, title, collaboration_type=1):
+        task = Task.objects.create(user=self.owner, title=title, difficulty=4, collaboration_type=collaboration_type)
+        TaskCollaborator.objects.create(task=task, user=self.member, invited_by=self.owner, accepted=True)
+        return task
+
+    def test_parallel_completion_pays_each_task_once(self):
+        tasks = [self.make_shared_task(f'shared {i}') for i in range(15)]
+        completed = []
+
+        def complete(user, task):
+            response = post_with_retry(user, f'/api/tasks/{task.id}/complete/')
+            self.assertIn(response.status_code, (200, 400), response.content)
+            if response.status_code == 200:
+                completed.append(task.id)
+
+        errors = run_threads(complete, [(user, task) for task in tasks for user in (self.owner, self.member)])
+        self.assertEqual(errors, [])
+
+        # Каждую задачу завершил ровно один из двух участников
+        self.assertCountEqual(completed, [task.id for task in tasks])
+        xp = sum(task.reward_xp for task in tasks)
+        gold = sum(task.reward_gold for task in tasks)
+        for user in (self.owner, self.member):
+            user.refresh_from_db()
+            self.assertEqual((user.xp, user.gold), (xp, gold))
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.completed_tasks_count, len(tasks))
+
+    def test_everyone_must_complete_in_parallel(self):
+        tasks = [self.make_shared_task(f'together {i}', collaboration_type=2) for i in range(15)]
+
+        def complete(user, task):
+            response = post_with_retry(user, f'/api/tasks/{task.id}/complete/')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        errors = run_threads(complete, [(user, task) for task in tasks for user in (self.owner, self.member)])
+        self.assertEqual(errors, [])
+
+        self.assertFalse(Task.objects.filter(id__in=[task.id for task in tasks], is_completed=False).exists())
+        xp = sum(task.reward_xp for task in tasks)
+        for user in (self.owner, self.member):
+            user.refresh_from_db()
+            self.assertEqual(user.xp, xp)
+
+
+class EveryoneMustCompleteTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@test.io', username='owner', password='x')
+        self.member = User.objects.create_user(email='member@test.io', username='member', password='x')
+        self.task = Task.objects.create(user=self.owner, title='together', collaboration_type=2)
+        TaskCollaborator.objects.create(task=self.task, user=self.member, invited_by=self.owner, accepted=True)
+        self.url = f'/api/tasks/{self.task.id}/complete/'
+
+    def test_owner_completion_is_stored(self):
+        response = client_for(self.owner).post(self.url)
+        self.assertEqual(response.json()['status'], 'Completion recorded.')
+        # Владелец не должен завершать повторно: задачу закрывает последний участник
+        response = client_for(self.member).post(self.url)
+        self.assertEqual(response.json()['status'], 'Task completed.')
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.is_completed)
+        self.assertFalse(self.task.owner_completed)
+
+    def test_uncomplete_clears_completion_marks(self):
+        client_for(self.member).post(self.url)
+        client_for(self.owner).post(self.url)
+        response = client_for(self.owner).post(f'/api/tasks/{self.task.id}/uncomplete/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(TaskCollaborator.objects.filter(task=self.task, completed=True).exists())
+
+        # После отмены снова нужны отметки всех участников
+        response = client_for(self.owner).post(self.url)
+        self.assertEqual(response.json()['status'], 'Completion recorded.')
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.xp, self.task.reward_xp)
+
+
+class TaskListQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner, *friends = make_users(4)
+        for friend in friends:
+            Friendship.befriend(self.owner, friend)
+        for i in range(120):
+            task = Task.objects.create(user=self.owner, title=f'task {i}')
+            TaskCollaborator.objects.create(task=task, user=friends[i % 3], invited_by=self.owner, accepted=True)
+        for i in range(30):
+            task = Task.objects.create(user=friends[i % 3], title=f'shared {i}')
+            TaskCollaborator.objects.create(task=task, user=self.owner, invited_by=friends[i % 3], accepted=True)
+        self.client = client_for(self.owner)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.client.get('/api/tasks/?page_size=1')  # прогрев кэшей друзей и рангов
+        small, response = self.count_queries(self.client, '/api/tasks/?page_size=5')
+        self.assertEqual(len(response.json()['results']), 5)
+        large, response = self.count_queries(self.client, '/api/tasks/?page_size=150')
+        self.assertEqual(len(response.json()['results']), 150)
+        self.assertEqual(small, large)
+
+    def test_cursor_walks_every_task_once(self):
+        seen, url = [], '/api/tasks/?page_size=40'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(task['id'] for task in page['results'])
+            url = page['next']
+        self.assertEqual(len(seen), 150)
+        self.assertEqual(len(set(seen)), 150)
+
+
+class BulkCompleteTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner, self.member = make_users(2)
+        ranks.rank_ladder()  # лестница рангов в памяти процесса — не часть запроса
+        self.addCleanup(ranks.invalidate_rank_ladder)
+        self.client = client_for(self.owner)
+
+    def make_batch(self, size):
+        tasks = [Task.objects.create(user=self.owner, title=f'task {i}', difficulty=i % 4 + 1) for i in range(size)]
+        for task in tasks[::2]:
+            TaskCollaborator.objects.create(task=task, user=self.member, invited_by=self.owner, accepted=True)
+        done = Task.objects.create(user=self.owner, title='done')
+        Task.objects.filter(id=done.id).update(is_completed=True)
+        return tasks, done
+
+    def bulk_complete(self, task_ids):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/tasks/bulk-complete/', {'task_ids': task_ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context), response.json()
+
+    def test_query_count_does_not_grow_with_batch(self):
+        counts = {}
+        for size in (3, 30):
+            tasks, done = self.make_batch(size)
+            counts[size], _ = self.bulk_complete([task.id for task in tasks] + [done.id])
+        self.assertEqual(counts[3], counts[30])
+
+    def test_results_and_rewards(self):
+        tasks, done = self.make_batch(4)
+        _, body = self.bulk_complete([task.id for task in tasks] + [done.id, 999999, tasks[0].id])
+
+        statuses = {row['id']: row['status'] for row in body['results']}
+        self.assertEqual(statuses, {
+            **{task.id: 'completed' for task in tasks}, done.id: 'already_completed', 999999: 'not_found',
+        })
+        # Повтор id в запросе не начисляет награду дважды
+        self.assertEqual(len(body['results']), 6)
+        xp, gold = sum(task.reward_xp for task in tasks), sum(task.reward_gold for task in tasks)
+        self.assertEqual((body['reward_xp'], body['reward_gold']), (xp, gold))
+        self.assertEqual((body['xp'], body['gold']), (xp, gold))
+
+        # Коллаборатор получает награды только за общие задачи
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.xp, sum(task.reward_xp for task in tasks[::2]))
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.completed_tasks_count, len(tasks))
+
+
+class RecurringResetTests(TestCase):
+    def setUp(self):
+        self.owner, self.member = make_users(2)
+        expired = timezone.now() - timedelta(days=8)
+        for i in range(35):
+            task = Task.objects.create(user=self.owner, title=f'daily {i}', type=DAILY if i % 2 else WEEKLY)
+            Task.objects.filter(id=task.id).update(is_completed=True, completed_at=expired)
+        User.objects.filter(id=self.owner.id).update(completed_tasks_count=35)
+        self.shared = Task.objects.filter(user=self.owner).first()
+        TaskCollaborator.objects.create(
+            task=self.shared, user=self.member, invited_by=self.owner, accepted=True, completed=True
+        )
+
+    def test_resets_in_bounded_chunks_and_resumes(self):
+        chunks = []
+        self.assertEqual(reset_expired_tasks(chunk_size=10, on_chunk=lambda _, count: chunks.append(count)), 35)
+        self.assertTrue(all(count <= 10 for count in chunks))
+        self.assertFalse(Task.objects.filter(is_completed=True).exists())
+        self.assertFalse(TaskCollaborator.objects.filter(completed=True).exists())
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.completed_tasks_count, 0)
+        # Повторный запуск (например, после падения) продолжает с места остановки
+        self.assertEqual(reset_expired_tasks(chunk_size=10), 0)
+
+    def test_benchmark_memory_is_bounded(self):
+        out = StringIO()
+        call_command('benchmark_task_reset', tasks=5000, users=20, chunk_size=500, max_memory_mb=8, stdout=out)
+        self.assertIn('Сброшено задач: 5035', out.getvalue())
+        # Бенчмарк откатывает свою транзакцию
+        self.assertEqual(Task.objects.count(), 35)
+
+
+class TaskSyncTests(TestCase):
+    def setUp(self):
+        self.owner, = make_users(1)
+        self.client = client_for(self.owner)
+        self.old = timezone.now() - timedelta(minutes=5)
+        for i in range(5):
+            task = Task.objects.create(user=self.owner, title=f'old {i}')
+            Task.objects.filter(id=task.id).update(updated_at=self.old)
+
+    def sync(self, cursor=None, page_size=2):
+        params = {'page_size': page_size}
+        if cursor:
+            params['since'] = cursor
+        return self.client.get('/api/tasks/sync/', params).json()
+
+    def full_sync(self, cursor=None):
+        seen = []
+        while True:
+            page = self.sync(cursor)
+            seen += [task['id'] for task in page['changed']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                return seen, cursor, page
+
+    def test_late_commit_is_not_skipped(self):
+        seen, cursor, _ = self.full_sync()
+        self.assertEqual(len(seen), 5)
+
+        # Транзакция проставила updated_at несколько секунд назад и закоммитилась только сейчас
+        late = Task.objects.create(user=self.owner, title='late')
+        Task.objects.filter(id=late.id).update(updated_at=timezone.now() - timedelta(seconds=3))
+        TaskTombstone.objects.create(user=self.owner, task_id=999, deleted_at=timezone.now() - timedelta(seconds=3))
+
+        seen, _, page = self.full_sync(cursor)
+        self.assertEqual(seen, [late.id])
+        self.assertEqual(page['deleted'], [999])
+
+    def test_fresh_changes_are_resent_until_settled(self):
+        fresh = Task.objects.create(user=self.owner, title='fresh')
+        seen, cursor, _ = self.full_sync()
+        self.assertIn(fresh.id, seen)
+        # Курсор не ушёл дальше now - safety_margin: свежая задача придёт ещё раз
+        seen, cursor, _ = self.full_sync(cursor)
+        self.assertEqual(seen, [fresh.id])
+
+    def test_many_fresh_changes_do_not_loop(self):
+        for i in range(5):
+            Task.objects.create(user=self.owner, title=f'fresh {i}')
+        # Свежие строки занимают только остаток последней страницы и не двигают курсор,
+        # поэтому has_more не зацикливается на них
+        seen, cursor, page = self.full_sync()
+        self.assertEqual(len(seen), 6)
+        self.assertFalse(page['has_more'])
+
+        # Когда они устоятся (здесь — граница сдвинута к now), следующая синхронизация пришлёт их все
+        with mock.patch.object(TaskSyncPagination, 'safety_margin', timedelta(0)):
+            seen, _, _ = self.full_sync(cursor)
+        self.assertEqual(len(seen), 5)
+
+    def test_deleting_users_reports_cascaded_tasks(self):
+        member, stranger = make_users(2, prefix='member')
+        shared = Task.objects.create(user=stranger, title='shared')
+        TaskCollaborator.objects.create(task=shared, user=self.owner, invited_by=stranger, accepted=True)
+        TaskCollaborator.objects.create(task=shared, user=member, invited_by=stranger, accepted=True)
+        _, cursor, _ = self.full_sync()
+
+        # Каскад удаления из queryset: надгробия получают оставшиеся участники, но не удалённый
+        User.objects.filter(id=stranger.id).delete()
+        self.assertEqual(set(TaskTombstone.objects.values_list('user_id', flat=True)), {self.owner.id, member.id})
+        with mock.patch.object(TaskSyncPagination, 'safety_margin', timedelta(0)):
+            _, _, page = self.full_sync(cursor)
+        self.assertEqual(page['deleted'], [shared.id])
+
+
+class PurgeExpiredRecordsTests(TestCase):
+    def setUp(self):
+        self.user, = make_users(1)
+
+    def purge(self):
+        out = StringIO()
+        call_command('purge_expired_records', stdout=out)
+        return out.getvalue()
+
+    def test_purges_only_expired_tombstones(self):
+        expired = timezone.now() - TaskTombstone.RETENTION - timedelta(hours=1)
+        TaskTombstone.objects.create(user=self.user, task_id=1, deleted_at=expired)
+        TaskTombstone.objects.create(user=self.user, task_id=2)
+
+        self.assertIn('Удалено устаревших отметок синхронизации: 1', self.purge())
+        self.assertEqual(list(TaskTombstone.objects.values_list('task_id', flat=True)), [2])
+
+    def test_purges_only_expired_idempotency_keys(self):
+        expired = timezone.now() - IdempotencyRecord.RETENTION - timedelta(hours=1)
+        IdempotencyRecord.objects.create(user=self.user, key='old', scope='shop.purchase:1', created_at=expired)
+        IdempotencyRecord.objects.create(user=self.user, key='new', scope='shop.purchase:1')
+
+        self.assertIn('Удалено устаревших ключей идемпотентности: 1', self.purge())
+        self.assertEqual(list(IdempotencyRecord.objects.values_list('key', flat=True)), ['new'])
+
+
+class TaskSearchTests(TestCase):
+    def setUp(self):
+        self.owner, self.other = make_users(2)
+        Task.objects.create(user=self.owner, title='Сдать отчёт', description='квартальный')
+        Task.objects.create(user=self.owner, title='Отчёт по спорту', description='отчёт отчёт')
+        Task.objects.create(user=self.owner, title='Купить молоко')
+        Task.objects.create(user=self.other, title='Чужой отчёт')
+
+    def test_ranked_results_of_own_tasks(self):
+        results = client_for(self.owner).get('/api/tasks/search/', {'q': 'отчёт'}).json()['results']
+        self.assertEqual([task['title'] for task in results], ['Отчёт по спорту', 'Сдать отчёт'])
+
+    def test_prefix_match(self):
+        results = client_for(self.owner).get('/api/tasks/search/', {'q': 'квартал'}).json()['results']
+        self.assertEqual([task['title'] for task in results], ['Сдать отчёт'])
+
+    def test_benchmark_latency_is_sublinear(self):
+        out = StringIO()
+        call_command('benchmark_task_search', sizes=[500, 5000], repeat=5, max_exponent=0.7, stdout=out)
+        self.assertIn('сублинейно', out.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN горячих запросов: ни один не читает растущую таблицу целиком."""
+
+    def setUp(self):
+        self.user, self.other = make_users(2)
+
+    def test_hot_queries_use_indexes(self):
+        with index_paths_only():
+            for name, queryset in hot_queries(self.user.id, self.other.id).items():
+                with self.subTest(query=name):
+                    plan = queryset.explain()
+                    self.assertEqual(seq_scanned_tables(plan), [], plan)
+
+    def test_full_scan_is_detected(self):
+        # Без индекса по title проверка должна сработать, иначе разбор планов сломан
+        with index_paths_only():
+            plan = Task.objects.filter(title='x').explain()
+        self.assertEqual(seq_scanned_tables(plan), [Task._meta.db_table])
+
+    def test_command_records_plans(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/plans.json'
+            call_command('check_query_plans', output=output, stdout=StringIO())
+            with open(output, encoding='utf-8') as f:
+                plans = json.load(f)
+        self.assertEqual(set(plans), set(hot_queries()))
+        self.assertTrue(all(plans.values()))
+
+class TaskExportTests(TestCase):
+    def setUp(self):
+        self.owner, = make_users(1)
+        self.client = client_for(self.owner)
+        self.done = Task.objects.create(user=self.owner, title='Сделано', difficulty=4)
+        self.client.post(f'/api/tasks/{self.done.id}/complete/')
+        aborted = Task.objects.create(user=self.owner, title='Брошено')
+        self.client.post(f'/api/tasks/{aborted.id}/delete/')
+
+    def export(self, file_format):
+        response = self.client.get('/api/tasks/export/', {'file_format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_includes_reward_history(self):
+        rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        tasks = [row for row in rows if 'record' not in row]
+        history = [row for row in rows if row.get('record') == 'history']
+        self.assertEqual([task['title'] for task in tasks], ['Сделано'])
+        self.assertEqual([entry['event'] for entry in history], ['completed', 'aborted'])
+        self.assertEqual(history[0]['xp'], self.done.reward_xp)
+        # Штраф за удалённую задачу остаётся в истории без task_id
+        self.assertIsNone(history[1]['task_id'])
+        self.assertLess(history[1]['xp'], 0)
+
+    def test_history_csv(self):
+        rows = list(csv.DictReader(self.export('history_csv').splitlines()))
+        self.assertEqual([row['event'] for row in rows], ['completed', 'aborted'])
+
+    def test_reimport_skips_history(self):
+        upload = SimpleUploadedFile('tasks.ndjson', self.export('ndjson').encode())
+        response = self.client.post('/api/tasks/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.json(), {'imported': 1, 'failed': 0, 'errors': []})
+
+
+class TaskImportTests(TestCase):
+    def test_invalid_date_is_reported_per_row(self):
+        user, = make_users(1)
+        lines = [
+            {'title': 'Первая', 'due_date': '2024-05-01T10:00:00'},
+            {'title': 'Несуществующая дата', 'due_date': '2024-13-45T00:00:00'},
+            {'title': 'Третья'},
+        ]
+        upload = SimpleUploadedFile('tasks.ndjson', ''.join(json.dumps(line) + '\n' for line in lines).encode())
+        response = client_for(user).post('/api/tasks/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        report = response.json()
+        self.assertEqual((report['imported'], report['failed']), (2, 1))
+        self.assertEqual(report['errors'][0]['row'], 2)
+        self.assertIn('due_date', report['errors'][0]['errors'])
+        self.assertEqual(
+            list(Task.objects.filter(user=user).order_by('id').values_list('title', flat=True)), ['Первая', 'Третья']
+        )
+
+class RankLadderCacheTests(TestCase):
+    def setUp(self):
+        Rank.objects.create(name='Новичок', required_xp=0)
+        ranks.invalidate_rank_ladder()
+        self.addCleanup(ranks.invalidate_rank_ladder)
+
+    def add_rank_elsewhere(self):
+        # Как будто ранг добавил другой процесс: его _ladder здесь не сброшен
+        Rank.objects.bulk_create([Rank(name='Мастер', required_xp=100)])
+
+    def test_version_bump_from_another_process(self):
+        self.assertEqual(ranks.rank_for_xp(150).name, 'Новичок')
+        self.add_rank_elsewhere()
+        cache.set(ranks.VERSION_KEY, 1, None)
+        with mock.patch.object(ranks, 'CHECK_INTERVAL', 0):
+            self.assertEqual(ranks.rank_for_xp(150).name, 'Мастер')
+
+    def test_ladder_expires_without_shared_version(self):
+        self.assertEqual(ranks.rank_for_xp(150).name, 'Новичок')
+        self.add_rank_elsewhere()
+        with mock.patch.object(ranks, 'CHECK_INTERVAL', 0):
+            self.assertEqual(ranks.rank_for_xp(150).name, 'Новичок')
+            with mock.patch.object(ranks, 'MAX_AGE', 0):
+                self.assertEqual(ranks.rank_for_xp(150).name, 'Мастер')
+
+
+class CharacterQueryCountTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        rank = Rank.objects.create(name='Новичок', required_xp=0)
+        ranks.invalidate_rank_ladder()
+        # Лестница живёт в памяти процесса и переживает откат БД после теста
+        self.addCleanup(ranks.invalidate_rank_ladder)
+        self.items = Shop.objects.bulk_create([
+            Shop(name=f'item {i}', type=Shop.ITEM_TYPES[i % 4][0], price=10, required_rank=rank)
+            for i in range(60)
+        ])
+
+    def make_character(self, username, item_count):
+        user, = make_users(1, prefix=username)
+        Inventory.objects.bulk_create([
+            Inventory(user=user, item=item, slot=Inventory.slot_for(item.type),
+                      is_unlocked=True, is_purchased=True, is_equipped=i < 4)
+            for i, item in enumerate(self.items[:item_count])
+        ])
+        return user
+
+    def test_cold_and_warm_cache(self):
+        url = '/api/character/get-character/'
+        ranks.rank_ladder()  # лестница рангов в памяти процесса — не часть запроса
+        counts = {}
+        for size in (4, 60):
+            user = self.make_character(f'size{size}-', size)
+            client = client_for(user)
+            cold, response = self.count_queries(client, url)
+            self.assertEqual(len(response.json()['inventory']), size)
+            warm, _ = self.count_queries(client, url)
+            counts[size] = (cold, warm)
+        # Один запрос инвентаря с предметами и их рангами при любом размере, из кэша — ни одного
+        self.assertEqual(counts[4], (1, 0))
+        self.assertEqual(counts[60], (1, 0))
+
+    def test_reward_invalidates_cached_payload(self):
+        user = self.make_character('reward-', 4)
+        # Новый клиент на каждый запрос: пользователь заново читается из БД, как при JWT
+        self.assertEqual(client_for(user).get('/api/character/get-character/').json()['gold'], 0)
+        User.objects.grant_rewards([user.id], xp=0, gold=25)
+        self.assertEqual(client_for(user).get('/api/character/get-character/').json()['gold'], 25)
+
+
+class LoadoutTests(QueryCountTestCase):
+    def setUp(self):
+        super().setUp()
+        Rank.objects.create(name='Новичок', required_xp=0)
+        ranks.rank_ladder()  # лестница рангов в памяти процесса — не часть запроса
+        self.addCleanup(ranks.invalidate_rank_ladder)
+        self.user, = make_users(1)
+        # По два предмета на слот, надет первый
+        self.entries = {slot: [] for slot in Inventory.SLOTS}
+        for i in range(8):
+            item = Shop.objects.create(name=f'item {i}', type=Inventory.SLOTS[i % 4], price=10)
+            self.entries[item.type].append(Inventory.objects.create(
+                user=self.user, item=item, is_unlocked=True, is_purchased=True, is_equipped=i < 4,
+            ))
+
+    def put_loadout(self, data):
+        # Новый клиент на каждый запрос: пользователь заново читается из БД, как при JWT
+        client = client_for(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.put('/api/character/loadout/', data, format='json')
+        return len(context), response
+
+    def equipped(self):
+        return set(Inventory.objects.filter(user=self.user, is_equipped=True).values_list('id', flat=True))
+
+    def test_query_count_does_not_grow_with_slots(self):
+        one, response = self.put_loadout({'top': self.entries['top'][1].id})
+        self.assertEqual(response.status_code, 200, response.content)
+        outfit = {slot: entries[1].id for slot, entries in self.entries.items()}
+        four, response = self.put_loadout({**outfit, 'top': self.entries['top'][0].id})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(one, four)
+
+        expected = {**outfit, 'top': self.entries['top'][0].id}
+        self.assertEqual({entry['id'] for entry in response.json()['equipped_items']}, set(expected.values()))
+        self.assertEqual(self.equipped(), set(expected.values()))
+
+    def test_unequip_and_slot_errors(self):
+        _, response = self.put_loadout({'hair': None})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.equipped(), {self.entries[slot][0].id for slot in ('top', 'bottom', 'boots')})
+
+        # Ошибка в одном слоте — ничего не меняется, ошибки по слотам
+        before = self.equipped()
+        _, response = self.put_loadout({'top': self.entries['top'][1].id, 'boots': self.entries['top'][0].id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ['boots'])
+        self.assertEqual(self.equipped(), before)
+
+class CharacterSpriteTests(TestCase):
+    def setUp(self):
+        self.user, = make_users(1)
+        self.items = [Shop.objects.create(name=f'item {i}', type=Inventory.SLOTS[i], price=10) for i in range(3)]
+        for item in self.items[:2]:
+            Inventory.objects.create(user=self.user, item=item, is_unlocked=True, is_purchased=True, is_equipped=True)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        sprites = self.settings(SPRITE_CACHE_DIR=self.cache_dir)
+        sprites.enable()
+        self.addCleanup(sprites.disable)
+
+    def cached_files(self):
+        return [name for _, _, names in os.walk(self.cache_dir) for name in names]
+
+    def test_worn_outfit_is_rendered(self):
+        response = self.client.get(sprite.sprite_url(self.items[:2]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_outfits_nobody_wears_are_not_rendered(self):
+        # Ключи верные, но таких наборов ни у кого нет: часть надетого и чужое сочетание
+        for items in (self.items[:1], self.items[1:]):
+            with self.subTest(items=[item.id for item in items]):
+                self.assertEqual(self.client.get(sprite.sprite_url(items)).status_code, 404)
+        self.assertEqual(self.cached_files(), [])
+
+class ShopCatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, = make_users(1)
+        Shop.objects.create(name='Шляпа', type='hair', price=10)
+
+    def test_cache_is_shared_between_processes(self):
+        # Версии каталога и рангов должны доходить до всех воркеров
+        self.assertNotIsInstance(cache, LocMemCache)
+
+    def test_version_bump_changes_etag(self):
+        response = client_for(self.user).get('/api/shop/')
+        etag = response['ETag']
+        self.assertEqual(client_for(self.user).get('/api/shop/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Как populate_shop.py: bulk_create без сигналов и явный подъём версии
+        Shop.objects.bulk_create([Shop(name='Ботинки', type='boots', price=20)])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+
+        response = client_for(self.user).get('/api/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+
+
+class ProfileSaveTests(TestCase):
+    """Профиль меняется со "старым" объектом пользователя, пока награда начисляется через F()."""
+
+    def setUp(self):
+        self.user, = make_users(1, password='x')
+        self.stale = User.objects.get(id=self.user.id)
+        User.objects.grant_rewards([self.user.id], xp=40, gold=50)
+
+    def assert_rewards_kept(self):
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.xp, self.user.gold), (40, 50))
+
+    def test_update_profile(self):
+        self.stale.update_profile(name='Новое имя', email='new@test.io')
+        self.assert_rewards_kept()
+        self.assertEqual((self.user.username, self.user.email), ('Новое имя', 'new@test.io'))
+
+    def test_change_password(self):
+        self.stale.change_password('x', 'new-password')
+        self.assert_rewards_kept()
+        self.assertTrue(self.user.check_password('new-password'))
+
+    def test_upload_avatar(self):
+        client = APIClient()
+        client.force_authenticate(self.stale)
+        avatar = SimpleUploadedFile('avatar.png', b'not really a png', content_type='image/png')
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            response = client.post('/api/user/upload_avatar/', {'avatar': avatar}, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_rewards_kept()
+
+
+class PurchaseStressTests(ConcurrentTestCase):
+    USERS, ITEMS, PRICE, START_GOLD = 4, 20, 10, 105  # золота хватает на 10 предметов из 20
+
+    def test_parallel_purchases(self):
+        users = [
+            User.objects.create_user(email=f'buyer{i}@test.io', username=f'buyer{i}', password='x', gold=self.START_GOLD)
+            for i in range(self.USERS)
+        ]
+        items = [Shop.objects.create(name=f'item {i}', type='top', price=self.PRICE) for i in range(self.ITEMS)]
+        responses = {}  # ключ идемпотентности -> ответы обоих устройств
+        lock = threading.Lock()
+
+        def device(user, plan):
+            for item, key in plan:
+                headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+                response = post_with_retry(user, f'/api/shop/{item.id}/purchase/', **headers)
+                self.assertIn(response.status_code, (200, 400), response.content)
+                if key:
+                    with lock:
+                        responses.setdefault(key, []).append((response.status_code, response.json()))
+
+        # Три "устройства" на пользователя пытаются купить всё; первые два повторяют одни и те же ключи
+        jobs = []
+        for user in users:
+            keys = {item.id: str(uuid.uuid4()) for item in items}
+            for number in range(3):
+                order = items if number % 2 == 0 else items[::-1]
+                jobs.append((user, [(item, keys[item.id] if number < 2 else None) for item in order]))
+
+        started = time.perf_counter()
+        errors = run_threads(device, jobs)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(errors, [])
+
+        for user in users:
+            user.refresh_from_db()
+            purchased = Inventory.objects.filter(user=user, is_purchased=True).count()
+            self.assertEqual(purchased, self.START_GOLD // self.PRICE)
+            self.assertEqual(user.gold, self.START_GOLD - purchased * self.PRICE)
+            rows = Inventory.objects.filter(user=user)
+            self.assertEqual(rows.count(), rows.values('item').distinct().count())
+
+        # Повтор с тем же ключом получает тот же ответ, а не вторую покупку
+        for replies in responses.values():
+            self.assertEqual(len(replies), 2)
+            self.assertEqual(replies[0], replies[1])
+
+        requests = len(jobs) * self.ITEMS
+        print(f"\nPurchaseStressTests: {requests} покупок за {elapsed:.2f} c ({requests / elapsed:.0f} запросов/с)")
+
+
+class UserSearchQueryCountTests(QueryCountTestCase):
+    """Поиск пользователей: число запросов не зависит от числа друзей в выдаче и размера таблицы."""
+
+    def search_friends(self, size):
+        me, = make_users(1, prefix=f'me{size}-')
+        pals = make_users(size, prefix=f'pal{size}-')
+        for pal in pals:
+            Friendship.befriend(me, pal)
+        make_users(size, prefix=f'stranger{size}-')
+        cache.clear()
+        client = client_for(me)
+        with self.assertNumQueries(5):
+            response = client.get('/api/user-search/', {'q': f'pal{size}-', 'page_size': 50})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_friend_lists_of_different_sizes(self):
+        for size in (3, 30):
+            results = self.search_friends(size)
+            self.assertEqual(len(results), size)
+            self.assertEqual({user['friendship_status'] for user in results}, {'friend'})
+
+    def test_exact_email_first(self):
+        results = self.search_friends(3)
+        me = User.objects.get(username='me3-0')
+        exact = client_for(me).get('/api/user-search/', {'q': 'pal3-2@test.io'}).json()['results']
+        self.assertEqual(exact[0]['email'], 'pal3-2@test.io')
+        self.assertEqual(len(results), 3)
+
+class FriendshipStatusQueryCountTests(QueryCountTestCase):
+    """Число запросов списков с friendship_status не зависит от числа строк."""
+
+    def make_scenario(self, size):
+        me, = make_users(1, prefix=f'me{size}-')
+        others = make_users(size, prefix=f'other{size}-')
+        for i, other in enumerate(others):
+            # Разные статусы дружбы: друг, входящий запрос, исходящий запрос
+            if i % 3 == 0:
+                Friendship.befriend(me, other)
+            elif i % 3 == 1:
+                FriendRequest.objects.create(from_user=other, to_user=me)
+            else:
+                FriendRequest.objects.create(from_user=me, to_user=other)
+            shared = Task.objects.create(user=other, title=f'shared {i}')
+            TaskCollaborator.objects.create(task=shared, user=me, invited_by=other, accepted=True)
+            pending = Task.objects.create(user=other, title=f'pending {i}')
+            TaskCollaborator.objects.create(task=pending, user=me, invited_by=other, accepted=False)
+        return client_for(me)
+
+    def assert_flat(self, url, rows):
+        counts = {}
+        for size in (3, 30):
+            client = self.make_scenario(size)
+            cache.clear()
+            cold, response = self.count_queries(client, url)
+            self.assertEqual(len(response.json()), rows(size))
+            warm, _ = self.count_queries(client, url)
+            counts[size] = (cold, warm)
+        self.assertEqual(counts[3], counts[30])
+
+    def test_friend_requests(self):
+        self.assert_flat('/api/friend-requests/', lambda size: size - (size + 2) // 3)
+
+    def test_task_collaborators(self):
+        self.assert_flat('/api/task-collaborators/', lambda size: 2 * size)
+
+    def test_pending_invitations(self):
+        self.assert_flat('/api/collaboration-invitations/pending-invitations/', lambda size: size)
+
+    def test_collaboration_tasks(self):
+        self.assert_flat('/api/collaboration-tasks/', lambda size: size)
+
+
+class UserCountersTests(TestCase):
+    def test_queryset_delete_keeps_survivors_counters(self):
+        gone, pal, other_pal, invitee = make_users(4)
+        Friendship.befriend(gone, pal)
+        Friendship.befriend(gone, other_pal)
+        Friendship.befriend(pal, other_pal)
+        FriendRequest.objects.create(from_user=gone, to_user=invitee)
+        Task.objects.create(user=pal, title='done', is_completed=True)
+
+        User.objects.filter(id=gone.id).delete()
+
+        counters = dict(User.objects.values_list('id', 'friends_count'))
+        self.assertEqual(counters, {pal.id: 1, other_pal.id: 1, invitee.id: 0})
+        invitee.refresh_from_db()
+        self.assertEqual(invitee.pending_requests_count, 0)
+        # Пересчёт по исходным таблицам ничего не находит
+        self.assertEqual(reconcile_counters(), 0)
+
+class FriendCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.friend, self.stranger = make_users(3)
+        Friendship.befriend(self.me, self.friend)
+        self.task = Task.objects.create(user=self.me, title='Вместе')
+
+    def invite(self, *users):
+        return client_for(self.me).post('/api/collaboration-invitations/send-invitation/', {
+            'task_id': self.task.id, 'collaborator_ids': [user.id for user in users],
+        }, format='json')
+
+    def test_new_friend_missing_from_cache_is_found(self):
+        self.assertEqual(friends.friend_ids(self.me.id), {self.friend.id})
+        # Дружбу создал другой процесс: здесь в кэше её ещё нет
+        Friendship.objects.bulk_create([Friendship(user1=self.me, user2=self.stranger)])
+        self.assertTrue(Friendship.are_friends(self.me, self.stranger))
+
+    def test_invitation_rechecks_cached_friend_in_db(self):
+        # Кэш другого процесса всё ещё считает stranger другом
+        cache.set(friends.cache_key(self.me.id), frozenset({self.friend.id, self.stranger.id}))
+        response = self.invite(self.friend, self.stranger)
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertFalse(TaskCollaborator.objects.filter(task=self.task).exists())
+
+        response = self.invite(self.friend)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(TaskCollaborator.objects.filter(task=self.task, user=self.friend).exists())
@@ -3,12 +3,13 @@ from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf import settings
 from django.conf.urls.static import static
-from django.urls import path
+from django.urls import path, re_path
 from .views import (
     RegisterViewSet, UserViewSet, TaskViewSet, CharacterViewSet,
     CustomTokenObtainPairView, LogoutViewSet, ShopViewSet, RankViewSet,
     UserSearchView, FriendRequestViewSet, FriendshipViewSet, TaskCollaboratorViewSet,
-    CollaborationCheckView, CollaborationInvitationViewSet, CollaborationTaskViewSet,
+    CollaborationCheckView, character_sprite, CollaborationInvitationViewSet, CollaborationTaskViewSet, TaskStatsViewSet,
+    LeaderboardViewSet,
 )
 
 router = DefaultRouter()
@@ -18,6 +19,8 @@ router.register(r'user', UserViewSet, basename='user')
 router.register(r'logout', LogoutViewSet, basename='logout')
 router.register(r'character', CharacterViewSet, basename='character')
 router.register(r'shop', ShopViewSet, basename='shop')
+router.register(r'stats', TaskStatsViewSet, basename='stats')
+router.register(r'leaderboard', LeaderboardViewSet, basename='leaderboard')
 router.register(r'ranks', RankViewSet, basename='rank')
 router.register(r'check-collaboration', CollaborationCheckView, basename='checkcollaboration')
 router.register(r'user-search', UserSearchView, basename='usersearch')
@@ -30,5 +33,6 @@ router.register(r'collaboration-tasks', CollaborationTaskViewSet, basename='coll
 urlpatterns = [
     path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('login/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    re_path(r'^character/sprites/(?P<key>[0-9a-f]{64})\.(?P<ext>png|webp)$', character_sprite, name='character_sprite'),
     path('', include(router.urls)),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -11,15 +11,55 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import serializers
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.http import StreamingHttpResponse, FileResponse, Http404
+from django.views.decorators.http import require_GET
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Q, F, Prefetch, OuterRef, Exists, ExpressionWrapper, BooleanField
+from django.utils import timezone
+from django.core.cache import cache
+from datetime import timedelta
 from .models import User, Task, Shop, Inventory, Rank
-from .models import FriendRequest, Friendship, TaskCollaborator
+from .models import FriendRequest, Friendship, TaskCollaborator, TaskTombstone, TaskStatsDaily, TaskHistory
 from .serializers import FriendRequestSerializer, FriendshipSerializer, TaskCollaboratorSerializer
 from .serializers import (
     UserSerializer, RegisterSerializer, TaskSerializer,
-    ItemSerializer, UserItemSerializer, CharacterSerializer,
-    CustomTokenObtainPairSerializer, RankSerializer
+    ItemSerializer, UserItemSerializer,
+    CustomTokenObtainPairSerializer, RankSerializer, BulkCompleteSerializer,
+    resolve_friendship_statuses, LeaderboardEntrySerializer, LoadoutSerializer, ShopListingSerializer,
 )
+from .pagination import (
+    TaskCursorPagination, TaskSyncPagination, TaskSearchPagination, LeaderboardPagination, UserSearchPagination,
+)
+from .search import search_tasks, search_users
+from .task_io import detect_import_format, import_tasks, EXPORTERS
+from .stats import record_completions, record_uncompletion, record_abort
+from .ranks import rank_by_id, next_rank_for_xp, is_rank_up
+from .character import character_payload, apply_loadout, invalidate_character, is_worn_outfit
+from .friends import friend_ids
+from .idempotency import idempotent
+from .catalog import catalog_payload, etag_matches
+from .sprite import FORMATS, sprite_key, sprite_path, get_or_render
+import os
+from collections import Counter
+
+
+def reward_state(request, rank_changes):
+    """
+    XP, золото и ранг пользователя после начисления наград и признак
+    повышения ранга — клиенту не нужно перезапрашивать персонажа.
+    """
+    user = request.user
+    user.refresh_from_db(fields=['xp', 'gold', 'rank'])
+    rank = rank_by_id(user.rank_id)
+    next_rank = next_rank_for_xp(user.xp)
+    context = {'request': request}
+    return {
+        'xp': user.xp,
+        'gold': user.gold,
+        'rank': RankSerializer(rank, context=context).data if rank else None,
+        'next_rank': RankSerializer(next_rank, context=context).data if next_rank else None,
+        'rank_up': is_rank_up(*rank_changes[user.id]) if user.id in rank_changes else False,
+    }
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -65,13 +105,24 @@ class CharacterViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='get-character')
     def get_character(self, request):
         try:
-            user = request.user
-            serializer = CharacterSerializer(user, context={'request': request})
-            return Response(serializer.data)
+            return Response(character_payload(request))
         except Exception as e:
             print(f"Error in get_character: {str(e)}")
             return Response({"error": str(e)}, status=500)
 
+    @action(detail=False, methods=['put'])
+    def loadout(self, request):
+        serializer = LoadoutSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            apply_loadout(request.user, serializer.validated_data)
+        except IntegrityError:
+            # Параллельная смена экипировки заняла слот раньше нас
+            return Response({'error': 'Экипировка изменилась, повторите запрос'}, status=status.HTTP_409_CONFLICT)
+        return Response(character_payload(request))
+
     @action(detail=False, methods=['post'], url_path='change-item')
     def change_item(self, request):
         user = request.user
@@ -89,42 +140,47 @@ class CharacterViewSet(viewsets.ViewSet):
                     status=400
                 )
 
-            item_type = inventory_item.item.type
-
-            # Снимаем все экипированные предметы того же типа
-            # Для hair/headwear обрабатываем как одну группу
-            if item_type in ['hair', 'headwear']:
-                Inventory.objects.filter(
-                    user=user,
-                    is_equipped=True
-                ).filter(
-                    Q(item__type='hair') | Q(item__type='headwear')
-                ).update(is_equipped=False)
-            else:
-                # Для других типов (top, bottom, boots) снимаем только предметы того же типа
-                Inventory.objects.filter(
-                    user=user,
-                    is_equipped=True,
-                    item__type=item_type
-                ).update(is_equipped=False)
-
-            # Надеваем выбранный предмет
-            inventory_item.is_equipped = True
-            inventory_item.save()
-
-            serializer = CharacterSerializer(user)
+            # Тот же путь, что и у loadout: один слот
+            apply_loadout(user, {inventory_item.slot: inventory_item})
+
             return Response({
                 'status': 'item changed',
-                'character': serializer.data
+                'character': character_payload(request),
             })
 
         except Inventory.DoesNotExist:
             return Response({'error': 'Item not found in inventory'}, status=404)
+        except IntegrityError:
+            return Response({'error': 'Equipment changed concurrently, retry'}, status=409)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
 
 
+@require_GET
+def character_sprite(request, key, ext):
+    """
+    Спрайт персонажа по хэшу слоёв (URL берётся из sprite_url в данных персонажа).
+    Содержимое по адресу не меняется, поэтому кэшируется клиентами навсегда.
+    Новый файл собирается только для набора, который кто-то сейчас носит.
+    """
+    path = sprite_path(key, ext)
+    if not os.path.exists(path):
+        try:
+            ids = {int(item_id) for item_id in request.GET.get('items', '').split(',')}
+        except ValueError:
+            raise Http404
+        items = list(Shop.objects.filter(id__in=ids)) if len(ids) <= len(Inventory.SLOTS) else []
+        if len(items) != len(ids) or sprite_key(items) != key or not is_worn_outfit(ids):
+            raise Http404
+        path = get_or_render(key, items, ext)
+
+    response = FileResponse(open(path, 'rb'), content_type=FORMATS[ext][1])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{key}.{ext}"'
+    return response
+
+
 class ShopViewSet(viewsets.ModelViewSet):
     queryset = Shop.objects.all()
     serializer_class = ItemSerializer
@@ -132,12 +188,50 @@ class ShopViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         try:
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            etag, data = catalog_payload(request)
+            if etag_matches(request, etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(data)
+            response['ETag'] = etag
+            # Клиент хранит каталог, но перепроверяет его по ETag при каждом заходе
+            response['Cache-Control'] = 'private, no-cache'
+            return response
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+    @action(detail=False, methods=['get'])
+    def personal(self, request):
+        """
+        Магазин с состоянием предметов для пользователя одним запросом:
+        куплен/разблокирован — Exists по инвентарю, доступность по рангу —
+        сравнение с XP пользователя, хватает ли золота — сравнение с ценой.
+        """
+        user = request.user
+        owned = Inventory.objects.filter(user=user, item=OuterRef('pk'))
+        items = Shop.objects.filter(is_default=False).select_related('required_rank').annotate(
+            is_unlocked=Exists(owned.filter(is_unlocked=True)),
+            is_purchased=Exists(owned.filter(is_purchased=True)),
+            is_available=ExpressionWrapper(
+                Q(required_rank__isnull=True) | Q(required_rank__required_xp__lte=user.xp),
+                output_field=BooleanField(),
+            ),
+            is_affordable=ExpressionWrapper(Q(price__lte=user.gold), output_field=BooleanField()),
+        ).order_by(
+            F('is_available').desc(), F('required_rank__required_xp').asc(nulls_first=True), 'id'
+        )
+
+        rank = user.current_rank
+        next_rank = next_rank_for_xp(user.xp)
+        context = {'request': request}
+        return Response({
+            'gold': user.gold,
+            'xp': user.xp,
+            'rank': RankSerializer(rank, context=context).data if rank else None,
+            'next_rank': RankSerializer(next_rank, context=context).data if next_rank else None,
+            'items': ShopListingSerializer(items, many=True, context=context).data,
+        })
+
     @action(detail=True, methods=['post'], url_path='unlock')
     def unlock(self, request, pk=None):
         try:
@@ -152,24 +246,24 @@ class ShopViewSet(viewsets.ModelViewSet):
                         {"detail": "У пользователя нет текущего ранга"},
                         status=400
                     )
-                # Сравниваем ранги
-                if user.current_rank.id < item.required_rank.id:
+                # Сравниваем ранги по месту в лестнице (как в personal)
+                if user.current_rank.required_xp < item.required_rank.required_xp:
                     return Response(
                         {"detail": f"Требуется ранг {item.required_rank.name} или выше"},
                         status=400
                     )
 
-            # Проверяем, не разблокирован ли уже предмет
-            if Inventory.objects.filter(user=user, item=item).exists():
+            # Создаем запись в инвентаре; повтор отсекает уникальность (user, item)
+            try:
+                with transaction.atomic():
+                    Inventory.objects.create(
+                        user=user,
+                        item=item,
+                        is_unlocked=True,
+                        is_purchased=False
+                    )
+            except IntegrityError:
                 return Response({"detail": "Предмет уже разблокирован"}, status=400)
-
-            # Создаем запись в инвентаре
-            Inventory.objects.create(
-                user=user,
-                item=item,
-                is_unlocked=True,
-                is_purchased=False
-            )
             
             return Response({"detail": "Предмет успешно разблокирован"})
         except Exception as e:
@@ -178,50 +272,248 @@ class ShopViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='purchase')
     def purchase(self, request, pk=None):
         try:
-            user = request.user
             item = self.get_object()
+            # Повтор с тем же Idempotency-Key получает сохранённый ответ без второго списания
+            return idempotent(request, f'shop.purchase:{item.id}', lambda: self.buy(request.user, item))
+        except Http404:
+            raise
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
 
-            inventory_item = Inventory.objects.filter(user=user, item=item).first()
-            if inventory_item and inventory_item.is_purchased:
+    def buy(self, user, item):
+        """
+        Покупка без чтения-изменения-записи: upsert записи инвентаря,
+        условный захват is_purchased и условное списание золота в БД.
+        """
+        with transaction.atomic():
+            Inventory.objects.bulk_create(
+                [Inventory(user=user, item=item, slot=Inventory.slot_for(item.type), is_unlocked=True)],
+                update_conflicts=True,
+                unique_fields=['user', 'item'],
+                update_fields=['is_unlocked'],
+            )
+            # Строка инвентаря блокируется: параллельная покупка того же предмета ждёт здесь
+            claimed = Inventory.objects.filter(user=user, item=item, is_purchased=False).update(is_purchased=True)
+            if not claimed:
                 return Response({"detail": "Предмет уже куплен."}, status=400)
 
-            if user.gold < item.price:
+            paid = User.objects.filter(id=user.id, gold__gte=item.price).update(gold=F('gold') - item.price)
+            if not paid:
+                transaction.set_rollback(True)
                 return Response({"detail": "Недостаточно золота для покупки."}, status=400)
 
-            user.gold -= item.price
-            user.save()
+            invalidate_character(user.id)
 
-            if inventory_item:
-                inventory_item.is_purchased = True
-                inventory_item.save()
-            else:
-                Inventory.objects.create(
-                    user=user,
-                    item=item,
-                    is_unlocked=True,
-                    is_purchased=True
-                )
-
-            return Response({"detail": "Предмет успешно куплен."}, status=200)
-        except Exception as e:
-            return Response({"error": str(e)}, status=500)
+        user.refresh_from_db(fields=['gold'])
+        return Response({"detail": "Предмет успешно куплен.", "gold": user.gold}, status=200)
 
 
 class TaskViewSet(viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TaskCursorPagination
+
+    def get_visible_tasks(self):
+        # Подзапрос вместо JOIN по collaborators: не нужен DISTINCT, и keyset-пагинация
+        # идёт по индексу (user, updated_at, id)
+        shared_task_ids = TaskCollaborator.objects.filter(
+            user=self.request.user, accepted=True
+        ).values('task_id')
+        return Task.objects.filter(
+            Q(user=self.request.user) |
+            Q(id__in=shared_task_ids)
+        )
 
     def get_queryset(self):
-        return Task.objects.select_related('user').prefetch_related('collaborators__user').filter(
-            Q(user=self.request.user) | 
-            Q(collaborators__user=self.request.user, collaborators__accepted=True)
-        ).distinct()
+        # UserSerializer отдаёт все поля, включая groups и user_permissions
+        user_m2m = ('groups', 'user_permissions')
+        return self.get_visible_tasks().select_related('user').prefetch_related(
+            *(f'user__{name}' for name in user_m2m),
+            Prefetch(
+                'collaborators',
+                queryset=TaskCollaborator.objects.filter(accepted=True).select_related(
+                    'user', 'invited_by'
+                ).prefetch_related(
+                    *(f'{rel}__{name}' for rel in ('user', 'invited_by') for name in user_m2m)
+                ),
+                to_attr='accepted_collaborators',
+            )
+        )
+
+    def list(self, request, *args, **kwargs):
+        tasks = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        serializer = self.get_page_serializer(tasks)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Изменения списка задач с момента курсора since: изменённые задачи
+        и id задач, которые удалены или стали недоступны пользователю.
+        """
+        paginator = TaskSyncPagination()
+        tasks = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+
+        deleted = []
+        since = paginator.get_since()
+        if since is not None and since < timezone.now() - TaskTombstone.RETENTION:
+            return Response(
+                {"detail": "Курсор устарел, нужна полная синхронизация"},
+                status=status.HTTP_410_GONE
+            )
+        if since is not None:
+            # since не позже now - safety_margin, так что поздно закоммиченные отметки тоже попадут
+            changed_ids = {task.id for task in tasks}
+            deleted = [
+                task_id for task_id in TaskTombstone.objects.filter(
+                    user=request.user, deleted_at__gte=since
+                ).values_list('task_id', flat=True).distinct()
+                if task_id not in changed_ids
+            ]
+
+        serializer = self.get_page_serializer(tasks)
+        return Response({
+            'changed': serializer.data,
+            'deleted': deleted,
+            'cursor': paginator.get_sync_cursor(),
+            'has_more': paginator.next_position is not None,
+        })
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Поиск по названию и описанию задач, по убыванию релевантности.
+        """
+        queryset = search_tasks(self.get_queryset(), request.query_params.get('q', ''), connection)
+        paginator = TaskSearchPagination()
+        tasks = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_page_serializer(tasks)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Импорт задач из CSV или NDJSON (поле file). Формат берётся из
+        поля format или из расширения файла.
+        """
+        uploaded = request.FILES.get('file')
+        if not uploaded:
+            return Response({"error": "No file provided"}, status=400)
+
+        file_format = detect_import_format(uploaded, request.data.get('format'))
+        if file_format is None:
+            return Response({"error": "Поддерживаются только CSV и NDJSON"}, status=400)
+
+        report = import_tasks(request.user, uploaded, file_format)
+        return Response(report, status=status.HTTP_201_CREATED if report['imported'] else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Выгрузка всех задач пользователя с коллабораторами и наградами и
+        его истории начислений. NDJSON по умолчанию (задачи, затем история),
+        CSV при file_format=csv (задачи) или history_csv (история). Отдаётся потоком.
+        """
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in EXPORTERS:
+            return Response({"error": "Поддерживаются только CSV и NDJSON"}, status=400)
+
+        queryset = self.get_visible_tasks().select_related('user').prefetch_related(
+            Prefetch(
+                'collaborators',
+                queryset=TaskCollaborator.objects.filter(accepted=True).select_related('user'),
+                to_attr='accepted_collaborators',
+            )
+        ).order_by('id')
+        history = TaskHistory.objects.filter(user=request.user).order_by('created_at', 'id')
+        content_type, stream = EXPORTERS[file_format]
+        response = StreamingHttpResponse(stream(queryset, history), content_type=content_type)
+        filename = 'task_history.csv' if file_format == 'history_csv' else f'tasks.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def get_page_serializer(self, tasks):
+        return self.get_serializer(tasks, many=True, context={
+            **self.get_serializer_context(),
+            'friendship_statuses': self.get_friendship_statuses(tasks),
+        })
+
+    def get_friendship_statuses(self, tasks):
+        # Все пользователи страницы: владельцы, коллабораторы и пригласившие
+        user_ids = set()
+        for task in tasks:
+            user_ids.add(task.user_id)
+            for collaborator in task.accepted_collaborators:
+                user_ids.update((collaborator.user_id, collaborator.invited_by_id))
+        return resolve_friendship_statuses(self.request.user, user_ids)
 
     def perform_create(self, serializer):
         # Automatically set the user and calculate rewards
         task = serializer.save(user=self.request.user)
 
+    def _complete_tasks(self, task_ids):
+        """
+        Завершает задачи текущего пользователя фиксированным числом запросов,
+        независимо от их количества. Возвращает задачи, статус по каждому id,
+        суммарные награды по участникам {user_id: (xp, gold)} и смены рангов.
+        """
+        user = self.request.user
+        now = timezone.now()
+        tasks = {
+            task.id: task for task in self.get_visible_tasks().select_for_update().filter(id__in=task_ids)
+        }
+        statuses = {
+            task_id: 'already_completed' if task_id in tasks else 'not_found'
+            for task_id in task_ids
+        }
+        open_tasks = [task for task in tasks.values() if not task.is_completed]
+
+        # "Все должны завершить": отмечаем пользователя и ждём остальных
+        waiting = set()
+        all_must_complete = [task.id for task in open_tasks if task.collaboration_type == 2]
+        if all_must_complete:
+            TaskCollaborator.objects.filter(
+                task_id__in=all_must_complete, user=user, accepted=True
+            ).update(completed=True)
+            owned = [task.id for task in open_tasks if task.collaboration_type == 2 and task.user_id == user.id]
+            if owned:
+                Task.objects.filter(id__in=owned).update(owner_completed=True)
+            waiting = set(TaskCollaborator.objects.filter(
+                task_id__in=all_must_complete, accepted=True, completed=False
+            ).values_list('task_id', flat=True))
+            # Задачи заблокированы select_for_update — отметка владельца актуальна
+            waiting.update(
+                task.id for task in open_tasks
+                if task.collaboration_type == 2 and task.user_id != user.id and not task.owner_completed
+            )
+
+        completed = [task for task in open_tasks if task.id not in waiting]
+        for task in open_tasks:
+            statuses[task.id] = 'completion_recorded' if task.id in waiting else 'completed'
+
+        rewards, rank_changes = {}, {}
+        if completed:
+            Task.objects.filter(id__in=[task.id for task in completed]).update(
+                is_completed=True, owner_completed=False, completed_at=now, updated_at=now
+            )
+            User.objects.adjust_counters('completed_tasks_count', Counter(task.user_id for task in completed))
+
+            participants = {task.id: {task.user_id} for task in completed}
+            for task_id, user_id in TaskCollaborator.objects.filter(
+                task_id__in=participants, accepted=True
+            ).values_list('task_id', 'user_id'):
+                participants[task_id].add(user_id)
+
+            for task in completed:
+                for user_id in participants[task.id]:
+                    xp, gold = rewards.get(user_id, (0, 0))
+                    rewards[user_id] = (xp + task.reward_xp, gold + task.reward_gold)
+            rank_changes = User.objects.grant_reward_map(rewards)
+            record_completions(completed, participants, now)
+
+        return tasks, statuses, rewards, rank_changes
+
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         task = self.get_object()
@@ -231,38 +523,41 @@ class TaskViewSet(viewsets.ModelViewSet):
                 task.collaborators.filter(user=request.user, accepted=True).exists()):
             return Response({"detail": "Вы не участвуете в этой задаче"}, status=403)
         
-        # Проверяем условия коллаборации
-        if task.collaboration_type == 2:  # Все должны завершить
-            # Помечаем, что этот пользователь завершил
-            collaborator = task.collaborators.get(user=request.user, accepted=True)
-            collaborator.completed = True
-            collaborator.save()
-            
-            # Проверяем, все ли завершили (включая владельца)
-            all_collaborators_completed = not task.collaborators.filter(accepted=True, completed=False).exists()
-            owner_completed = task.is_completed if task.user != request.user else True
-            
-            if all_collaborators_completed and owner_completed:
-                task.is_completed = True
-                # Начисляем награду всем участникам
-                participants = [task.user] + list(task.collaborators.filter(accepted=True).values_list('user', flat=True))
-                for user_id in participants:
-                    user = User.objects.get(id=user_id)
-                    user.xp += task.reward_xp
-                    user.gold += task.reward_gold
-                    user.save()
-        else:  # Любой может завершить
-            task.is_completed = True
-            # Начисляем награду всем участникам
-            participants = [task.user] + list(task.collaborators.filter(accepted=True).values_list('user', flat=True))
-            for user_id in participants:
-                user = User.objects.get(id=user_id)
-                user.xp += task.reward_xp
-                user.gold += task.reward_gold
-                user.save()
-        
-        task.save()
-        return Response({'status': 'Task completed.'})
+        with transaction.atomic():
+            _, statuses, _, rank_changes = self._complete_tasks([task.id])
+
+        if statuses[task.id] == 'already_completed':
+            return Response({'status': 'Task already completed.'}, status=400)
+        if statuses[task.id] == 'completion_recorded':
+            return Response({'status': 'Completion recorded.', **reward_state(request, rank_changes)})
+        return Response({'status': 'Task completed.', **reward_state(request, rank_changes)})
+
+    @action(detail=False, methods=['post'], url_path='bulk-complete')
+    def bulk_complete(self, request):
+        serializer = BulkCompleteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        task_ids = list(dict.fromkeys(serializer.validated_data['task_ids']))
+        with transaction.atomic():
+            tasks, statuses, rewards, rank_changes = self._complete_tasks(task_ids)
+
+        earned_xp, earned_gold = rewards.get(request.user.id, (0, 0))
+
+        return Response({
+            'results': [
+                {
+                    'id': task_id,
+                    'status': statuses[task_id],
+                    'reward_xp': tasks[task_id].reward_xp if statuses[task_id] == 'completed' else 0,
+                    'reward_gold': tasks[task_id].reward_gold if statuses[task_id] == 'completed' else 0,
+                }
+                for task_id in task_ids
+            ],
+            'reward_xp': earned_xp,
+            'reward_gold': earned_gold,
+            **reward_state(request, rank_changes),
+        })
     
     @action(detail=True, methods=['delete'], url_path='remove-collaborator/(?P<collaborator_id>[^/.]+)')
     def remove_collaborator(self, request, pk=None, collaborator_id=None):
@@ -287,21 +582,26 @@ class TaskViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def uncomplete(self, request, pk=None):
         task = self.get_object()
-        if task.is_completed:
-            task.is_completed = False
-            task.save()
-            user = request.user
-
-            # Проверяем, чтобы не уйти в минус
-            user.xp = max(0, user.xp - task.reward_xp)
-            user.gold = max(0, user.gold - task.reward_gold)
-            user.save()
+        with transaction.atomic():
+            uncompleted = Task.objects.filter(id=task.id, is_completed=True).update(
+                is_completed=False, completed_at=None, updated_at=timezone.now()
+            )
+            if uncompleted:
+                # Отметки "все должны завершить" снимаются вместе с выполнением
+                TaskCollaborator.objects.filter(task_id=task.id, completed=True).update(completed=False)
+                User.objects.adjust_counters('completed_tasks_count', {task.user_id: -1})
+                # Списание в БД, без ухода в минус
+                rank_changes = User.objects.grant_rewards([request.user.id], xp=-task.reward_xp, gold=-task.reward_gold)
+                record_uncompletion(task, request.user)
+        if uncompleted:
+            state = reward_state(request, rank_changes)
 
             return Response({
                 'status': 'Task uncompleted.',
                 'reward_xp': -task.reward_xp,
                 'reward_gold': -task.reward_gold,
-                'user': UserSerializer(user).data,
+                'user': UserSerializer(request.user).data,
+                **state,
             })
         else:
             return Response({'status': 'Task already uncompleted.'}, status=400)
@@ -319,14 +619,16 @@ class TaskViewSet(viewsets.ModelViewSet):
             print("aborting")
             user = request.user
             
-            user.xp = max(0, user.xp - 2 * task.reward_xp)
-            user.gold = max(0, user.gold - 2 * task.reward_gold)
-            user.save() 
-            task.delete()
+            with transaction.atomic():
+                rank_changes = User.objects.grant_rewards([user.id], xp=-2 * task.reward_xp, gold=-2 * task.reward_gold)
+                record_abort(task, user)
+                task.delete()
+            state = reward_state(request, rank_changes)
             
             return Response({
                 'status': "Task aborted.",
                 'user': UserSerializer(user).data,
+                **state,
             })
         
         
@@ -374,7 +676,7 @@ class UserViewSet(viewsets.ViewSet):
 
         # Продолжить обработку загрузки
         user.avatar = avatar
-        user.save()
+        user.save(update_fields=['avatar'])
         return Response({
             "detail": "Avatar updated successfully!",
             "avatar_url": request.build_absolute_uri(user.avatar.url)
@@ -445,6 +747,52 @@ class LogoutViewSet(viewsets.ViewSet):
                 return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"error": "Refresh token required"}, status=status.HTTP_400_BAD_REQUEST)
 
+class TaskStatsViewSet(viewsets.ViewSet):
+    """
+    Статистика выполнения задач из дневных сводок: стоимость ответа
+    зависит от числа дней в окне, а не от числа задач.
+    """
+    permission_classes = [IsAuthenticated]
+    max_days = 366
+
+    def list(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days должен быть числом'}, status=status.HTTP_400_BAD_REQUEST)
+        days = max(1, min(days, self.max_days))
+        group = request.query_params.get('group', 'day')
+        if group not in ('day', 'week'):
+            return Response({'error': 'group: day или week'}, status=status.HTTP_400_BAD_REQUEST)
+
+        today = timezone.localdate()
+        start = today - timedelta(days=days - 1)
+        rows = TaskStatsDaily.objects.filter(
+            user=request.user, day__gte=start, day__lte=today
+        ).order_by('day').values('day', *TaskStatsDaily.COUNTERS)
+
+        buckets = {}
+        totals = dict.fromkeys(TaskStatsDaily.COUNTERS, 0)
+        for row in rows:
+            day = row.pop('day')
+            if group == 'week':
+                day -= timedelta(days=day.weekday())
+            bucket = buckets.setdefault(day, dict.fromkeys(('completed', 'aborted', 'xp', 'gold'), 0))
+            for name, value in row.items():
+                totals[name] += value
+                if name in bucket:
+                    bucket[name] += value
+
+        return Response({
+            'from': start,
+            'to': today,
+            'group': group,
+            'series': [{'date': day, **bucket} for day, bucket in buckets.items()],
+            'totals': {name: totals[name] for name in ('completed', 'aborted', 'xp', 'gold')},
+            'difficulty': {level: totals[f'difficulty_{level}'] for level, _ in Task.DIFFICULTY_CHOICES},
+        })
+
+
 class RankViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Rank.objects.all()
     serializer_class = RankSerializer
@@ -509,21 +857,110 @@ class UpdateProfileSerializer(serializers.Serializer):
         
 #! FRIENDS SECTION
 
+class LeaderboardViewSet(viewsets.ViewSet):
+    """
+    Таблицы лидеров по XP. Страницы выбираются по индексу (xp DESC, id)
+    без OFFSET, позиция пользователя — подсчётом тех, кто выше него.
+    Ответы кэшируются на короткое время: таблица может отставать на cache_timeout.
+    """
+    permission_classes = [IsAuthenticated]
+    cache_timeout = 30
+
+    def get_queryset(self):
+        return User.objects.filter(is_active=True).only('id', 'username', 'avatar', 'xp', 'rank_id')
+
+    def board(self, request, key, queryset):
+        paginator = LeaderboardPagination()
+        page_key = f"leaderboard:{key}:{paginator.get_page_size(request)}:{request.query_params.get('cursor', '')}"
+        page = cache.get(page_key)
+        if page is None:
+            rows = paginator.paginate_queryset(queryset, request, view=self)
+            page = {
+                'next': paginator.get_next_link(),
+                'results': list(LeaderboardEntrySerializer(rows, many=True, context={'request': request}).data),
+            }
+            cache.set(page_key, page, self.cache_timeout)
+
+        user = request.user
+        me_key = f"leaderboard:{key}:me:{user.id}"
+        me = cache.get(me_key)
+        if me is None:
+            above = queryset.filter(Q(xp__gt=user.xp) | Q(xp=user.xp, id__lt=user.id)).count()
+            me = {'id': user.id, 'xp': user.xp, 'position': above + 1}
+            cache.set(me_key, me, self.cache_timeout)
+
+        return Response({**page, 'me': me})
+
+    @action(detail=False, methods=['get'], url_path='global')
+    def global_board(self, request):
+        return self.board(request, 'global', self.get_queryset())
+
+    @action(detail=False, methods=['get'])
+    def friends(self, request):
+        user = request.user
+        board_ids = friend_ids(user.id) | {user.id}
+        return self.board(request, f'friends:{user.id}', self.get_queryset().filter(id__in=board_ids))
+
+
 class UserSearchView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        query = request.query_params.get("q", "")
-        users = User.objects.filter(
-            Q(username__icontains=query) | Q(email__icontains=query)
-        ).exclude(id=request.user.id)
-        serializer = UserSerializer(users, many=True, context={'request': request})
-        return Response(serializer.data)
+        """
+        Поиск по началу имени или email, точное совпадение email — первым.
+        Постраничный (cursor), не больше USER_SEARCH_LIMIT совпадений на поле.
+        """
+        # UserSerializer отдаёт все поля, включая groups и user_permissions
+        users = User.objects.exclude(id=request.user.id).prefetch_related('groups', 'user_permissions')
+        queryset = search_users(users, request.query_params.get("q", ""), connection)
+        paginator = UserSearchPagination()
+        users = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = UserSerializer(users, many=True, context={
+            'request': request,
+            'friendship_statuses': resolve_friendship_statuses(request.user, [user.id for user in users]),
+        })
+        return paginator.get_paginated_response(serializer.data)
+
+
+def related_user_ids(objects, fields):
+    return {getattr(obj, f'{field}_id') for obj in objects for field in fields}
+
+
+def with_related_users(queryset, fields):
+    # UserSerializer отдаёт все поля, включая groups и user_permissions
+    return queryset.select_related(*fields).prefetch_related(
+        *(f'{field}__{name}' for field in fields for name in ('groups', 'user_permissions'))
+    )
+
+
+class FriendshipStatusMixin:
+    """
+    Статусы дружбы (UserSerializer.friendship_status) для всех пользователей,
+    которых отдаёт сериализатор, считаются двумя запросами на весь ответ.
+    Пользователи берутся из полей friendship_user_fields каждого объекта.
+    """
+    friendship_user_fields = ()
+
+    def get_friendship_user_ids(self, objects):
+        return related_user_ids(objects, self.friendship_user_fields)
 
+    def get_serializer(self, *args, **kwargs):
+        instance = args[0] if args else kwargs.get('instance')
+        if instance is not None:
+            objects = instance if kwargs.get('many') else [instance]
+            kwargs['context'] = {
+                **self.get_serializer_context(),
+                'friendship_statuses': resolve_friendship_statuses(
+                    self.request.user, self.get_friendship_user_ids(objects)
+                ),
+            }
+        return super().get_serializer(*args, **kwargs)
 
-class FriendRequestViewSet(viewsets.ModelViewSet):
+
+class FriendRequestViewSet(FriendshipStatusMixin, viewsets.ModelViewSet):
     serializer_class = FriendRequestSerializer
     permission_classes = [IsAuthenticated]
+    friendship_user_fields = ('from_user', 'to_user')
 
     def get_queryset(self):
         # Получаем параметр для фильтрации (только входящие или все)
@@ -531,15 +968,16 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         
         if request_type == 'sent':
             # Только отправленные запросы
-            return FriendRequest.objects.filter(from_user=self.request.user)
+            queryset = FriendRequest.objects.filter(from_user=self.request.user)
         elif request_type == 'received':
             # Только полученные запросы
-            return FriendRequest.objects.filter(to_user=self.request.user)
+            queryset = FriendRequest.objects.filter(to_user=self.request.user)
         else:
             # Все запросы (отправленные и полученные) - по умолчанию
-            return FriendRequest.objects.filter(
+            queryset = FriendRequest.objects.filter(
                 Q(from_user=self.request.user) | Q(to_user=self.request.user)
             )
+        return with_related_users(queryset, self.friendship_user_fields)
 
     def perform_create(self, serializer):
         to_user_id = self.request.data.get("to_user")
@@ -555,11 +993,12 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
         if friend_request.to_user != request.user:
             return Response({"detail": "Нельзя принять чужой запрос"}, status=403)
         
-        # Создаем дружбу
-        Friendship.befriend(friend_request.from_user, friend_request.to_user)
-        
-        # Удаляем запрос после принятия
-        friend_request.delete()
+        with transaction.atomic():
+            # Создаем дружбу
+            Friendship.befriend(friend_request.from_user, friend_request.to_user)
+
+            # Удаляем запрос после принятия
+            friend_request.delete()
         
         return Response({"status": "accepted"})
 
@@ -578,7 +1017,14 @@ class FriendshipViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Friendship.objects.filter(Q(user1=self.request.user) | Q(user2=self.request.user))
+        # Надетые предметы обеих сторон — для sprite_url друга без запроса на строку
+        equipped = Inventory.objects.filter(is_equipped=True).select_related('item')
+        return Friendship.objects.filter(
+            Q(user1=self.request.user) | Q(user2=self.request.user)
+        ).select_related('user1', 'user2').prefetch_related(
+            Prefetch('user1__inventory', queryset=equipped, to_attr='equipped_inventory'),
+            Prefetch('user2__inventory', queryset=equipped, to_attr='equipped_inventory'),
+        )
     
     def destroy(self, request, *args, **kwargs):
         try:
@@ -594,14 +1040,15 @@ class FriendshipViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=500)
 
 
-class TaskCollaboratorViewSet(viewsets.ModelViewSet):
+class TaskCollaboratorViewSet(FriendshipStatusMixin, viewsets.ModelViewSet):
     serializer_class = TaskCollaboratorSerializer
     permission_classes = [IsAuthenticated]
+    friendship_user_fields = ('user', 'invited_by')
 
     def get_queryset(self):
-        return TaskCollaborator.objects.filter(
+        return with_related_users(TaskCollaborator.objects.filter(
             Q(user=self.request.user) | Q(invited_by=self.request.user)
-        )
+        ), self.friendship_user_fields)
 
     def perform_create(self, serializer):
         user_id = self.request.data.get("user")
@@ -624,6 +1071,21 @@ class TaskCollaboratorViewSet(viewsets.ModelViewSet):
         collaborator.delete()
         return Response({"status": "rejected"})
 
+def first_non_friend(user, collaborator_ids, verify=False):
+    """
+    Первый из collaborator_ids, кто не друг user, или None. Все друзья —
+    одно чтение кэша (verify=True — один запрос к БД перед записью);
+    User читается только для ответа об ошибке (User.DoesNotExist, если
+    такого пользователя нет).
+    """
+    ids = list(dict.fromkeys(int(collaborator_id) for collaborator_id in collaborator_ids))
+    statuses = Friendship.are_friends_bulk(user, ids, verify=verify)
+    for collaborator_id in ids:
+        if not statuses[collaborator_id]:
+            return User.objects.get(id=collaborator_id)
+    return None
+
+
 class CollaborationCheckView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
     
@@ -634,14 +1096,12 @@ class CollaborationCheckView(viewsets.ViewSet):
             task_id = request.data.get('task_id')
             
             # Проверяем, что все коллабораторы являются друзьями
-            for collaborator_id in collaborator_ids:
-                collaborator = User.objects.get(id=collaborator_id)
-                
-                if not Friendship.are_friends(request.user, collaborator):
-                    return Response({
-                        "detail": f"Пользователь {collaborator.email} не является вашим другом",
-                        "user_id": collaborator_id
-                    }, status=400)
+            collaborator = first_non_friend(request.user, collaborator_ids)
+            if collaborator is not None:
+                return Response({
+                    "detail": f"Пользователь {collaborator.email} не является вашим другом",
+                    "user_id": collaborator.id
+                }, status=400)
             
             return Response({"detail": "Все пользователи являются друзьями"}, status=200)
             
@@ -663,29 +1123,24 @@ class CollaborationInvitationViewSet(viewsets.ViewSet):
             
             task = Task.objects.get(id=task_id, user=request.user)
             
-            created_count = 0
-            already_exists_count = 0
-            
-            for collaborator_id in collaborator_ids:
-                collaborator = User.objects.get(id=collaborator_id)
-                if not Friendship.are_friends(request.user, collaborator):
-                    return Response({
-                        "detail": f"Пользователь {collaborator.email} не является вашим другом"
-                    }, status=400)
-                
-                # Проверяем, не было ли уже приглашения
-                if TaskCollaborator.objects.filter(task=task, user=collaborator).exists():
-                    already_exists_count += 1
-                    continue
-                
-                # Создаем приглашение
-                TaskCollaborator.objects.create(
-                    task=task,
-                    user=collaborator,
-                    invited_by=request.user,
-                    accepted=False
-                )
-                created_count += 1
+            # Все приглашённые должны быть друзьями — проверяем по БД до создания приглашений
+            collaborator = first_non_friend(request.user, collaborator_ids, verify=True)
+            if collaborator is not None:
+                return Response({
+                    "detail": f"Пользователь {collaborator.email} не является вашим другом"
+                }, status=400)
+
+            # Проверяем, не было ли уже приглашения
+            ids = list(dict.fromkeys(int(collaborator_id) for collaborator_id in collaborator_ids))
+            existing = set(TaskCollaborator.objects.filter(task=task, user_id__in=ids).values_list('user_id', flat=True))
+            already_exists_count = len(existing)
+
+            # Создаем приглашения (updated_at задачи обновит task.save() ниже)
+            created = TaskCollaborator.objects.bulk_create([
+                TaskCollaborator(task=task, user_id=user_id, invited_by=request.user, accepted=False)
+                for user_id in ids if user_id not in existing
+            ])
+            created_count = len(created)
             
             task.collaboration_status = 1  # Ожидание
             task.save()
@@ -699,15 +1154,6 @@ class CollaborationInvitationViewSet(viewsets.ViewSet):
             return Response({"detail": "Пользователь не найден"}, status=404)
 
 
-    @action(detail=False, methods=['get'], url_path='pending-invitations')
-    def pending_invitations(self, request):
-        invitations = TaskCollaborator.objects.filter(
-            user=request.user,
-            accepted=False
-        )
-        serializer = TaskCollaboratorSerializer(invitations, many=True)
-        return Response(serializer.data)
-
     @action(detail=True, methods=['post'], url_path='respond-invitation')
     def respond_invitation(self, request, pk=None):
         try:
@@ -745,20 +1191,37 @@ class CollaborationInvitationViewSet(viewsets.ViewSet):
         
     @action(detail=False, methods=['get'], url_path='pending-invitations')
     def pending_invitations(self, request):
-        invitations = TaskCollaborator.objects.filter(
+        fields = ('user', 'invited_by')
+        invitations = list(with_related_users(TaskCollaborator.objects.filter(
             user=request.user,
             accepted=False
-        ).select_related('task', 'invited_by')
-        serializer = TaskCollaboratorSerializer(invitations, many=True)
+        ), fields))
+        serializer = TaskCollaboratorSerializer(invitations, many=True, context={
+            'request': request,
+            'friendship_statuses': resolve_friendship_statuses(request.user, related_user_ids(invitations, fields)),
+        })
         return Response(serializer.data)
     
-class CollaborationTaskViewSet(viewsets.ReadOnlyModelViewSet):
+class CollaborationTaskViewSet(FriendshipStatusMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         # Задачи, где пользователь является коллаборатором
-        return Task.objects.filter(
+        return with_related_users(Task.objects.filter(
             collaborators__user=self.request.user,
             collaborators__accepted=True
-        )
\ No newline at end of file
+        ), ('user',)).prefetch_related(
+            Prefetch(
+                'collaborators',
+                queryset=with_related_users(TaskCollaborator.objects.filter(accepted=True), ('user', 'invited_by')),
+                to_attr='accepted_collaborators',
+            )
+        )
+
+    def get_friendship_user_ids(self, tasks):
+        # Владельцы, коллабораторы и пригласившие
+        user_ids = related_user_ids(tasks, ('user',))
+        for task in tasks:
+            user_ids |= related_user_ids(task.accepted_collaborators, ('user', 'invited_by'))
+        return user_ids
\ No newline at end of file
@@ -30,6 +30,7 @@ const FriendsScreen = () => {
     const [friends, setFriends] = useState([]);
     const [friendRequests, setFriendRequests] = useState([]);
     const [searchResults, setSearchResults] = useState([]);
+    const [searchNext, setSearchNext] = useState(null);
     const [searchQuery, setSearchQuery] = useState("");
     const [loading, setLoading] = useState(true);
     const [searching, setSearching] = useState(false);
@@ -99,7 +100,8 @@ const FriendsScreen = () => {
             if (!response.ok) throw new Error("Ошибка поиска пользователей");
 
             const data = await response.json();
-            setSearchResults(data);
+            setSearchResults(data.results);
+            setSearchNext(data.next);
             setActiveTab("search");
         } catch (error) {
             console.error("Ошибка поиска:", error);
@@ -113,6 +115,29 @@ const FriendsScreen = () => {
         }
     };
 
+    const loadMoreSearchResults = async () => {
+        if (!searchNext || searching) return;
+
+        setSearching(true);
+        try {
+            let token = await getToken();
+
+            const response = await fetch(searchNext, {
+                headers: { Authorization: `Bearer ${token.access}` },
+            });
+
+            if (!response.ok) throw new Error("Ошибка поиска пользователей");
+
+            const data = await response.json();
+            setSearchResults(prev => [...prev, ...data.results]);
+            setSearchNext(data.next);
+        } catch (error) {
+            console.error("Ошибка поиска:", error);
+        } finally {
+            setSearching(false);
+        }
+    };
+
     const sendFriendRequest = async (userId) => {
         try {
             let token = await getToken();
@@ -455,6 +480,8 @@ const FriendsScreen = () => {
                                 data={searchResults}
                                 renderItem={renderSearchItem}
                                 keyExtractor={item => item.id.toString()}
+                                onEndReached={loadMoreSearchResults}
+                                onEndReachedThreshold={0.5}
                             />
                         ) : (
                             <View style={styles.emptyState}>
@@ -663,27 +663,24 @@ const ProfileScreen = () => {
         }),
       ]).start();
 
-      const response = await fetch(`${API_BASE}/api/character/change-item/`, {
-        method: 'POST',
+      // hair и headwear занимают один слот
+      const slot = itemType === 'headwear' ? 'hair' : itemType;
+      const response = await fetch(`${API_BASE}/api/character/loadout/`, {
+        method: 'PUT',
         headers: {
           'Authorization': `Bearer ${token.access}`,
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ inventory_item_id: itemId }),
+        body: JSON.stringify({ [slot]: itemId }),
       });
 
       if (!response.ok) throw new Error("Ошибка при экипировке предмета");
 
-      const updatedResponse = await fetch(`${API_BASE}/api/character/get-character/`, {
-        headers: { Authorization: `Bearer ${token.access}` },
-      });
-
-      if (updatedResponse.ok) {
-        const updatedData = await updatedResponse.json();
-        setInventory(updatedData.inventory || []);
-        const equipped = updatedData.inventory?.filter(item => item.is_equipped === true) || [];
-        setEquippedItems(equipped);
-      }
+      // Ответ — актуальные данные персонажа, повторный запрос не нужен
+      const updatedData = await response.json();
+      setInventory(updatedData.inventory || []);
+      const equipped = updatedData.inventory?.filter(item => item.is_equipped === true) || [];
+      setEquippedItems(equipped);
 
       Toast.show({ type: "success", text1: "Предмет экипирован" });
     } catch (error) {
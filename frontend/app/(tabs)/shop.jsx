@@ -46,88 +46,28 @@ const ShopScreen = () => {
 
   const getShopAndBalanceWithToken = async (accessToken) => {
     try {
-      const [shopResponse, characterResponse, ranksResponse] = await Promise.all([
-        fetch(`${API_BASE}/api/shop/`, {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${accessToken}`,
-          },
-        }),
-        fetch(`${API_BASE}/api/character/get-character/`, {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${accessToken}`,
-          },
-        }),
-        fetch(`${API_BASE}/api/ranks/`, {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${accessToken}`,
-          },
-        })
-      ]);
-
-      if (!shopResponse.ok) throw new Error("Ошибка при получении магазина");
-      const items = await shopResponse.json();
-
-      let inventoryItems = [];
-      let userXP = 0;
-      let userGold = 0;
-
-      if (characterResponse.ok) {
-        const characterData = await characterResponse.json();
-        inventoryItems = characterData.inventory || [];
-        userXP = characterData.xp || 0;
-        userGold = characterData.gold || 0;
-      }
-
-      // Получаем данные о рангах
-      let currentRank = null;
-      let nextRank = null;
-      const ranksData = ranksResponse.ok ? await ranksResponse.json() : [];
-      const sortedRanks = [...ranksData].sort((a, b) => a.required_xp - b.required_xp);
-
-      for (let i = 0; i < sortedRanks.length; i++) {
-        const rank = sortedRanks[i];
-        if (userXP >= rank.required_xp) {
-          currentRank = rank;
-        } else if (!nextRank) {
-          nextRank = rank;
-        }
-      }
-
-      // Объединяем данные о предметах
-      const mergedItems = items
-        .filter(item => !item.is_default)
-        .map(item => {
-          const inventoryItem = inventoryItems.find(i => i.item && i.item.id === item.id);
-          const isAvailable = !item.required_rank ||
-            (currentRank && currentRank.id >= item.required_rank.id);
-
-          return {
-            ...item,
-            is_unlocked: inventoryItem ? inventoryItem.is_unlocked : false,
-            is_purchased: inventoryItem ? inventoryItem.is_purchased : false,
-            is_available: isAvailable,
-            required_rank_name: item.required_rank?.name || null
-          };
-        });
-
-      // Сортируем: сначала доступные, потом по рангу
-      mergedItems.sort((a, b) => {
-        if (a.is_available !== b.is_available) return a.is_available ? -1 : 1;
-        return (a.required_rank?.id || 0) - (b.required_rank?.id || 0);
+      // Состояние предметов (куплен/разблокирован/доступен по рангу) считает сервер
+      const response = await fetch(`${API_BASE}/api/shop/personal/`, {
+        method: "GET",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${accessToken}`,
+        },
       });
 
-      setShopItems(mergedItems);
+      if (!response.ok) throw new Error("Ошибка при получении магазина");
+      const data = await response.json();
+
+      // Сервер уже отсортировал: сначала доступные, потом по рангу
+      setShopItems(data.items.map(item => ({
+        ...item,
+        required_rank_name: item.required_rank?.name || null
+      })));
       setCharacterData({
-        gold: userGold,
-        xp: userXP,
-        rank: currentRank,
-        next_rank: nextRank
+        gold: data.gold,
+        xp: data.xp,
+        rank: data.rank,
+        next_rank: data.next_rank
       });
 
     } catch (error) {
@@ -22,7 +22,7 @@ import ConfirmDeleteModal from "../compnents/confirmDeleteModal";
 import { isTokenExpired, refreshAccessToken } from "../lib/authTokenManager";
 import CollaborationConfirmModal from '../compnents/CollaborationConfirmModal';
 import { getToken, setToken } from "../lib/storage";
-import { createTask, updateTask } from "../lib/api";
+import { createTask, updateTask, fetchAllTasks } from "../lib/api";
 import { API_BASE } from "../lib/api";
 import CollaborationNotifications from "../compnents/CollaborationNotifications";
 import RankProgressCircle from "../compnents/RankProgressCircle";
@@ -250,14 +250,8 @@ const Tasks = () => {
 
   const getUserTasksAndBalanceWithToken = async (accessToken) => {
     try {
-      const [tasksResponse, characterResponse, ranksResponse] = await Promise.all([
-        fetch(`${API_BASE}/api/tasks/`, {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${accessToken}`,
-          },
-        }),
+      const [tasksData, characterResponse, ranksResponse] = await Promise.all([
+        fetchAllTasks(accessToken),
         fetch(`${API_BASE}/api/character/get-character/`, {
           method: "GET",
           headers: {
@@ -274,8 +268,6 @@ const Tasks = () => {
         })
       ]);
 
-      if (!tasksResponse.ok) throw new Error(`Ошибка задач: ${tasksResponse.statusText}`);
-      const tasksData = await tasksResponse.json();
       setTasks(tasksData);
 
       if (characterResponse.ok && ranksResponse.ok) {
@@ -323,107 +315,34 @@ const Tasks = () => {
         completed: updatedStatus,
       }, access);
 
-      // Получаем текущие данные перед обновлением
-      const currentXP = characterData.xp;
-      const currentGold = characterData.gold;
       const currentRank = characterData.rank;
 
-      if (updatedStatus) {
-        // Завершаем задачу (существующая логика)
-        await fetch(`${API_BASE}/api/tasks/${taskId}/complete/`, {
+      // Сервер возвращает новые XP, золото и ранг вместе с признаком повышения
+      const response = await fetch(
+        `${API_BASE}/api/tasks/${taskId}/${updatedStatus ? "complete" : "uncomplete"}/`,
+        {
           method: "POST",
           headers: {
             Authorization: `Bearer ${access}`,
           },
-        });
-
-        // Вычисляем новые значения
-        const newXP = currentXP + (taskToUpdate.reward_xp || 0);
-        const newGold = currentGold + (taskToUpdate.reward_gold || 0);
-
-        // Проверяем, изменился ли ранг
-        const ranksResponse = await fetch(`${API_BASE}/api/ranks/`, {
-          headers: {
-            Authorization: `Bearer ${access}`,
-          },
-        });
-        const ranksData = await ranksResponse.json();
-        const sortedRanks = [...ranksData].sort((a, b) => a.required_xp - b.required_xp);
-
-        let userNewRank = null;
-        let userNextRank = null;
-
-        for (let i = 0; i < sortedRanks.length; i++) {
-          const rank = sortedRanks[i];
-          if (newXP >= rank.required_xp) {
-            userNewRank = rank;
-          } else if (!userNextRank) {
-            userNextRank = rank;
-          }
         }
+      );
+      const result = await response.json();
 
-        // Если ранг изменился, запускаем анимацию
-        if (userNewRank && userNewRank.id !== currentRank?.id) {
+      if (response.ok && result.xp !== undefined) {
+        if (result.rank_up) {
           setOldRank(currentRank);
-          setNewRank(userNewRank);
+          setNewRank(result.rank);
           setShowRankUp(true);
         }
 
         // Обновляем состояние
         setCharacterData(prev => ({
           ...prev,
-          xp: newXP,
-          gold: newGold,
-          rank: userNewRank || prev.rank,
-          next_rank: userNextRank
-        }));
-      } else {
-        // Отменяем выполнение задачи (обновленная логика)
-        await fetch(`${API_BASE}/api/tasks/${taskId}/uncomplete/`, {
-          method: "POST",
-          headers: {
-            Authorization: `Bearer ${access}`,
-          },
-        });
-
-        // Вычисляем новые значения с учетом отмена
-        const newXP = Math.max(0, currentXP - (taskToUpdate.reward_xp || 0));
-        const newGold = Math.max(0, currentGold - (taskToUpdate.reward_gold || 0));
-
-        // Получаем актуальные данные о рангах
-        const ranksResponse = await fetch(`${API_BASE}/api/ranks/`, {
-          headers: {
-            Authorization: `Bearer ${access}`,
-          },
-        });
-        const ranksData = await ranksResponse.json();
-        const sortedRanks = [...ranksData].sort((a, b) => a.required_xp - b.required_xp);
-
-        let userNewRank = null;
-        let userNextRank = null;
-
-        for (let i = 0; i < sortedRanks.length; i++) {
-          const rank = sortedRanks[i];
-          if (newXP >= rank.required_xp) {
-            userNewRank = rank;
-          } else if (!userNextRank) {
-            userNextRank = rank;
-          }
-        }
-
-        // Если ранг изменился (понизился), обновляем состояние
-        if (userNewRank?.id !== currentRank?.id) {
-          setOldRank(currentRank);
-          setNewRank(userNewRank);
-        }
-
-        // Обновляем состояние
-        setCharacterData(prev => ({
-          ...prev,
-          xp: newXP,
-          gold: newGold,
-          rank: userNewRank || null,
-          next_rank: userNextRank
+          xp: result.xp,
+          gold: result.gold,
+          rank: result.rank,
+          next_rank: result.next_rank
         }));
       }
 
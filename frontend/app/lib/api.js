@@ -39,6 +39,32 @@ export const createTask = async (taskData, accessToken) => {
   }
 };
 
+// Список задач отдаётся страницами (keyset-пагинация) — проходим по ссылкам next
+export const fetchAllTasks = async (accessToken) => {
+  const tasks = [];
+  let url = `${API_BASE}/api/tasks/?page_size=200`;
+
+  while (url) {
+    const response = await fetch(url, {
+      method: "GET",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${accessToken}`,
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error(`Ошибка задач: ${response.statusText}`);
+    }
+
+    const page = await response.json();
+    tasks.push(...page.results);
+    url = page.next;
+  }
+
+  return tasks;
+};
+
 export const updateTask = async (taskId, taskData, accessToken) => {
   try {
     const payload = {